@@ -4,16 +4,36 @@ from PyQt6.QtCore import Qt, QDate, QTimer
 from PyQt6.QtGui import QFont, QPainter, QColor
 from PyQt6.QtCharts import QChart, QChartView, QPieSeries, QBarSeries, QBarSet, QBarCategoryAxis, QValueAxis
 import db_methods
+from events import DeferredRefreshMixin
+from charts import set_bar_values, set_axis_categories, fit_value_axis
+from query_runner import query_runner
 from datetime import datetime
 
+REFRESH_DELAY_MS = 300  # пауза после последнего изменения дат перед пересчетом графиков
 
-class AnalyticsTab(QWidget):
+# Цвета для категорий
+CATEGORY_COLORS = [
+    QColor("#ff6b6b"), QColor("#4ecdc4"), QColor("#45b7d1"),
+    QColor("#96ceb4"), QColor("#feca57"), QColor("#ff9ff3"),
+    QColor("#54a0ff"), QColor("#5f27cd"), QColor("#00d2d3")
+]
+
+
+class AnalyticsTab(DeferredRefreshMixin, QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.parent = parent
+        self.skipped_refreshes = 0  # сколько пересчетов отменено, потому что даты успели измениться еще раз
+
+        # Изменения дат копятся, графики пересчитываются один раз после паузы
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.setInterval(REFRESH_DELAY_MS)
+        self.refresh_timer.timeout.connect(self.refresh_data)
+
         self.initUI()
-        # Не обновляем данные сразу, ждем пока интерфейс создастся
-        QTimer.singleShot(100, self.refresh_data)
+        # Не обновляем данные сразу, ждем пока вкладку покажут
+        self.data_dirty = True
 
     def initUI(self):
         main_layout = QHBoxLayout(self)
@@ -76,6 +96,26 @@ class AnalyticsTab(QWidget):
         end_layout.addStretch()
         layout.addLayout(end_layout)
 
+        # Группировка столбцов графика
+        group_layout = QHBoxLayout()
+        group_label = QLabel("Группировка:")
+        self.group_by_combo = QComboBox()
+        for text, group_by in (("Авто", 'auto'), ("По дням", 'day'), ("По неделям", 'week'),
+                               ("По месяцам", 'month'), ("По кварталам", 'quarter'), ("По годам", 'year')):
+            self.group_by_combo.addItem(text, group_by)
+        self.group_by_combo.currentIndexChanged.connect(self.schedule_refresh)
+        group_layout.addWidget(group_label)
+        group_layout.addWidget(self.group_by_combo)
+        group_layout.addStretch()
+        layout.addLayout(group_layout)
+
+        # Индикатор фоновой загрузки данных для графиков
+        self.loading_label = QLabel("Загрузка...")
+        self.loading_label.setStyleSheet("color: #6c757d; border: none;")
+        self.loading_label.hide()
+        query_runner.busy_changed.connect(self.on_query_busy)
+        layout.addWidget(self.loading_label)
+
         layout.addStretch()
 
         return panel
@@ -91,6 +131,7 @@ class AnalyticsTab(QWidget):
         layout.addWidget(chart_label)
 
         self.bar_chart_view = QChartView()
+        self.bar_chart_view.setChart(self.create_bar_chart())
         layout.addWidget(self.bar_chart_view, 2)
 
         # Круговая диаграмма расходов
@@ -105,11 +146,18 @@ class AnalyticsTab(QWidget):
         self.pie_chart_view = QChartView()
         self.pie_chart_view.setRenderHint(QPainter.RenderHint.Antialiasing)
         self.pie_chart_view.setMinimumSize(300, 300)
+        self.pie_chart_view.setChart(self.create_pie_chart())
         pie_layout.addWidget(self.pie_chart_view)
 
-        # Легенда справа
+        # Легенда справа: строки создаются по мере надобности и потом только переиспользуются
         self.categories_legend = QFrame()
         self.categories_legend.setMaximumWidth(200)
+        self.legend_layout = QVBoxLayout(self.categories_legend)
+        self.legend_rows = []  # (строка, цветная точка, подпись)
+        self.no_data_label = QLabel("Нет данных")
+        self.no_data_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.legend_layout.addWidget(self.no_data_label)
+        self.legend_layout.addStretch()
         pie_layout.addWidget(self.categories_legend)
 
         layout.addLayout(pie_layout, 1)
@@ -131,7 +179,7 @@ class AnalyticsTab(QWidget):
                 self.start_date_edit.setDate(start_date)
                 self.end_date_edit.setDate(today)
 
-            self.refresh_data()
+            self.schedule_refresh()
         except Exception as e:
             print(f"Ошибка при изменении типа периода: {e}")
 
@@ -143,181 +191,206 @@ class AnalyticsTab(QWidget):
             end_date = self.end_date_edit.date()
 
             if start_date > end_date:
-                self.start_date_edit.setDate(end_date)
-                self.end_date_edit.setDate(start_date)
-            else:
-                self.refresh_data()
+                # меняем даты местами без лишних сигналов dateChanged
+                for date_edit, value in ((self.start_date_edit, end_date), (self.end_date_edit, start_date)):
+                    date_edit.blockSignals(True)
+                    date_edit.setDate(value)
+                    date_edit.blockSignals(False)
+            self.schedule_refresh()
         except Exception as e:
             print(f"Ошибка при изменении дат: {e}")
 
+    def schedule_refresh(self):
+        """ Отложенный пересчет: каждый новый вызов сдвигает его на REFRESH_DELAY_MS """
+        if self.refresh_timer.isActive():
+            self.skipped_refreshes += 1
+        self.refresh_timer.start()
+
+    def refresh_stats(self):
+        """ Сколько пересчетов (по два запроса к БД) удалось не выполнить """
+        return {
+            'skipped_refreshes': self.skipped_refreshes,
+            'cancelled_queries': query_runner.cancelled_count('analytics'),
+        }
+
+    def is_affected_by(self, change):
+        """ Графики зависят только от операций внутри выбранного периода """
+        if not change.touches('operation', 'category'):
+            return False
+        start_date = self.start_date_edit.date().toString(Qt.DateFormat.ISODate)
+        end_date = self.end_date_edit.date().toString(Qt.DateFormat.ISODate)
+        return change.affects_dates(start_date, end_date)
+
+    def on_query_busy(self, key, busy):
+        if key == 'analytics':
+            self.loading_label.setVisible(busy)
+
+    @staticmethod
+    def load_data(start_date, end_date, group_by):
+        """ Данные для обоих графиков (выполняется в фоновом потоке) """
+        if group_by == 'auto':
+            # столбцов не больше MAX_CHART_BUCKETS, сколько бы ни длился период
+            group_by = db_methods.db_manager.choose_bucket(start_date, end_date)
+        chart_data = db_methods.db_manager.get_income_expense_by_period(start_date, end_date, group_by)
+        expense_stats = db_methods.db_manager.get_expense_statistics(start_date, end_date)
+        return chart_data, expense_stats, group_by
+
     def refresh_data(self):
-        """ Обновление данных на вкладке """
+        """ Обновление данных на вкладке (запросы выполняются в фоне) """
+        self.refresh_timer.stop()
         try:
             start_date = self.start_date_edit.date().toString(Qt.DateFormat.ISODate)
             end_date = self.end_date_edit.date().toString(Qt.DateFormat.ISODate)
-            self.update_bar_chart(start_date, end_date)
-            self.update_pie_chart(start_date, end_date)
+            group_by = self.group_by_combo.currentData()
+            query_runner.submit('analytics', self.load_data, start_date, end_date, group_by,
+                                callback=self.show_data)
         except Exception as e:
             print(f"Ошибка при обновлении аналитики: {e}")
 
-    def update_bar_chart(self, start_date, end_date):
+    def show_data(self, result):
+        chart_data, expense_stats, group_by = result
+        self.update_bar_chart(chart_data, group_by)
+        self.update_pie_chart(expense_stats)
+
+    def create_bar_chart(self):
+        """ График доходов/расходов создается один раз, при обновлении меняются только данные """
+        self.income_set = QBarSet("Доходы")
+        self.income_set.setColor(QColor("#28a745"))
+
+        self.expense_set = QBarSet("Расходы")
+        self.expense_set.setColor(QColor("#dc3545"))
+
+        series = QBarSeries()
+        series.append(self.income_set)
+        series.append(self.expense_set)
+
+        chart = QChart()
+        chart.addSeries(series)
+        chart.setAnimationOptions(QChart.AnimationOption.SeriesAnimations)
+
+        # Настраиваем оси
+        self.bar_axis_x = QBarCategoryAxis()
+        chart.addAxis(self.bar_axis_x, Qt.AlignmentFlag.AlignBottom)
+        series.attachAxis(self.bar_axis_x)
+
+        self.bar_axis_y = QValueAxis()
+        self.bar_axis_y.setLabelFormat("%.0f")
+        chart.addAxis(self.bar_axis_y, Qt.AlignmentFlag.AlignLeft)
+        series.attachAxis(self.bar_axis_y)
+
+        # Настраиваем легенду
+        chart.legend().setVisible(True)
+        chart.legend().setAlignment(Qt.AlignmentFlag.AlignBottom)
+        return chart
+
+    def create_pie_chart(self):
+        self.pie_series = QPieSeries()
+        self.pie_series.setHoleSize(0.0)
+
+        chart = QChart()
+        chart.addSeries(self.pie_series)
+        chart.setTitle("")
+        chart.legend().setVisible(False)
+        return chart
+
+    def update_bar_chart(self, chart_data, group_by):
         """ Обновление графика доходов/расходов """
+        chart = self.bar_chart_view.chart()
         try:
-            # Определяем как группировать данные
-            if self.period_type_combo.currentText() == "За месяц":
-                group_by = 'day'
-            else:
-                group_by = 'month'
-
-            # Получаем данные для графика
-            chart_data = db_methods.db_manager.get_income_expense_by_period(start_date, end_date, group_by)
-
-            if not chart_data:
+            # Пустые периоды приходят с нулями, поэтому "нет данных" - это все нули
+            if not any(data['income'] or data['expense'] for data in chart_data):
                 # Если нет данных - показываем сообщение
-                chart = QChart()
+                chart_data = []
                 chart.setTitle("Нет данных за выбранный период")
-                self.bar_chart_view.setChart(chart)
-                return
-
-            # Создаем наборы данных для столбцов
-            income_set = QBarSet("Доходы")
-            income_set.setColor(QColor("#28a745"))
-
-            expense_set = QBarSet("Расходы")
-            expense_set.setColor(QColor("#dc3545"))
-
-            categories = []
-
-            # Заполняем данные
-            for data in chart_data:
-                income_set.append(data['income'])
-                expense_set.append(data['expense'])
-
-                if group_by == 'day':
-                    # Форматируем дату для отображения
-                    date_obj = datetime.strptime(data['period'], '%Y-%m-%d')
-                    categories.append(date_obj.strftime('%d.%m'))
-                else:
-                    # Форматируем месяц для отображения
-                    date_obj = datetime.strptime(data['period'], '%Y-%m')
-                    categories.append(date_obj.strftime('%b %Y'))
-
-            # Создаем серию столбцов
-            series = QBarSeries()
-            series.append(income_set)
-            series.append(expense_set)
-
-            # Создаем и настраиваем график
-            chart = QChart()
-            chart.addSeries(series)
-            chart.setAnimationOptions(QChart.AnimationOption.SeriesAnimations)
-
-            # Настраиваем оси
-            axis_x = QBarCategoryAxis()
-            axis_x.append(categories)
-            chart.addAxis(axis_x, Qt.AlignmentFlag.AlignBottom)
-            series.attachAxis(axis_x)
-
-            axis_y = QValueAxis()
-            axis_y.setLabelFormat("%.0f")
-            chart.addAxis(axis_y, Qt.AlignmentFlag.AlignLeft)
-            series.attachAxis(axis_y)
-
-            # Настраиваем легенду
-            chart.legend().setVisible(True)
-            chart.legend().setAlignment(Qt.AlignmentFlag.AlignBottom)
-
-            self.bar_chart_view.setChart(chart)
+            else:
+                chart.setTitle("")
+
+            categories = [self.period_label(data['period'], group_by) for data in chart_data]
+            incomes = [data['income'] for data in chart_data]
+            expenses = [data['expense'] for data in chart_data]
+            set_bar_values(self.income_set, incomes)
+            set_bar_values(self.expense_set, expenses)
+            set_axis_categories(self.bar_axis_x, categories)
+            fit_value_axis(self.bar_axis_y, incomes, expenses)
         except Exception as e:
             print(f"Ошибка при обновлении столбчатого графика: {e}")
-            chart = QChart()
             chart.setTitle("Ошибка при загрузке данных")
-            self.bar_chart_view.setChart(chart)
 
-    def update_pie_chart(self, start_date, end_date):
-        """ Обновление круговой диаграммы расходов"""
+    @staticmethod
+    def period_label(period, group_by):
+        """ Подпись столбца по периоду из get_income_expense_by_period """
+        if group_by in ('day', 'week'):
+            # Форматируем дату для отображения (неделя подписывается понедельником)
+            return datetime.strptime(period, '%Y-%m-%d').strftime('%d.%m')
+        if group_by == 'month':
+            # Форматируем месяц для отображения
+            return datetime.strptime(period, '%Y-%m').strftime('%b %Y')
+        if group_by == 'quarter':
+            year, quarter = period.split('-Q')
+            return f"{quarter} кв. {year}"
+        return period
+
+    def update_pie_chart(self, expense_stats):
+        """ Обновление круговой диаграммы расходов: существующие секции переиспользуются """
+        chart = self.pie_chart_view.chart()
         try:
-            # Получаем статистику расходов по категориям
-            expense_stats = db_methods.db_manager.get_expense_statistics(start_date, end_date)
-
             if not expense_stats:
                 # Если нет данных
-                chart = QChart()
+                expense_stats = []
                 chart.setTitle("Нет данных о расходах за выбранный период")
-                self.pie_chart_view.setChart(chart)
-                self.update_legend([])
-                return
-
-            # Создаем серию для круговой диаграммы
-            series = QPieSeries()
-            series.setHoleSize(0.0)
-
-            # Цвета для категорий
-            colors = [
-                QColor("#ff6b6b"), QColor("#4ecdc4"), QColor("#45b7d1"),
-                QColor("#96ceb4"), QColor("#feca57"), QColor("#ff9ff3"),
-                QColor("#54a0ff"), QColor("#5f27cd"), QColor("#00d2d3")
-            ]
-
-            # Добавляем секции в диаграмму
-            for i, stat in enumerate(expense_stats):
-                slice = series.append(stat['name'], stat['total'])
-                slice.setColor(colors[i % len(colors)])
-                slice.setLabelVisible(False)  # убираем подписи на самой диаграмме
+            else:
+                chart.setTitle("")
 
-            # Создаем и настраиваем график
-            chart = QChart()
-            chart.addSeries(series)
-            chart.setTitle("")
-            chart.legend().setVisible(False)
+            slices = self.pie_series.slices()
+            for i, stat in enumerate(expense_stats):
+                if i < len(slices):
+                    slice = slices[i]
+                    slice.setLabel(stat['name'])
+                    slice.setValue(stat['total'])
+                else:
+                    slice = self.pie_series.append(stat['name'], stat['total'])
+                    slice.setLabelVisible(False)  # убираем подписи на самой диаграмме
+                slice.setColor(CATEGORY_COLORS[i % len(CATEGORY_COLORS)])
+            # лишние секции от прошлого периода
+            for slice in slices[len(expense_stats):]:
+                self.pie_series.remove(slice)
 
-            self.pie_chart_view.setChart(chart)
             self.update_legend(expense_stats)
         except Exception as e:
             print(f"Ошибка при обновлении круговой диаграммы: {e}")
-            chart = QChart()
             chart.setTitle("Ошибка при загрузке данных")
-            self.pie_chart_view.setChart(chart)
+
+    def legend_row(self, index):
+        """ Строка легенды из пула (создается, если строк пока меньше) """
+        while len(self.legend_rows) <= index:
+            row = QWidget()
+            row_layout = QHBoxLayout(row)
+            row_layout.setContentsMargins(0, 0, 0, 0)
+            # Цветная точка
+            color_label = QLabel("●")
+            # Название категории и сумма
+            name_label = QLabel()
+            row_layout.addWidget(color_label)
+            row_layout.addWidget(name_label)
+            row_layout.addStretch()
+            # новые строки встают перед растяжкой в конце легенды
+            self.legend_layout.insertWidget(self.legend_layout.count() - 1, row)
+            self.legend_rows.append((row, color_label, name_label))
+        return self.legend_rows[index]
 
     def update_legend(self, expense_stats):
         """ Обновление легенды категорий """
         try:
-            # Очищаем старую легенду
-            layout = self.categories_legend.layout()
-            if layout:
-                for i in reversed(range(layout.count())):
-                    item = layout.itemAt(i)
-                    if item.widget():
-                        item.widget().setParent(None)
-            else:
-                layout = QVBoxLayout(self.categories_legend)
-
-            if not expense_stats:
-                no_data_label = QLabel("Нет данных")
-                no_data_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-                layout.addWidget(no_data_label)
-                return
+            self.no_data_label.setVisible(not expense_stats)
 
             # Находим категорию с самыми большими расходами
-            max_expense = max(expense_stats, key=lambda x: x['total'])
-
-            # Цвета для категорий
-            colors = [
-                QColor("#ff6b6b"), QColor("#4ecdc4"), QColor("#45b7d1"),
-                QColor("#96ceb4"), QColor("#feca57"), QColor("#ff9ff3"),
-                QColor("#54a0ff"), QColor("#5f27cd"), QColor("#00d2d3")
-            ]
+            max_expense = max(expense_stats, key=lambda x: x['total']) if expense_stats else None
 
-            # Добавляем элементы легенды
             for i, stat in enumerate(expense_stats):
-                item_layout = QHBoxLayout()
-
-                # Цветная точка
-                color_label = QLabel("●")
-                color_label.setStyleSheet(f"color: {colors[i % len(colors)].name()}; font-size: 20px;")
-
-                # Название категории и сумма
-                name_label = QLabel(f"{stat['name']}: {stat['total']:.2f} ₽")
+                row, color_label, name_label = self.legend_row(i)
+                color_label.setStyleSheet(
+                    f"color: {CATEGORY_COLORS[i % len(CATEGORY_COLORS)].name()}; font-size: 20px;")
+                name_label.setText(f"{stat['name']}: {stat['total']:.2f} ₽")
 
                 # Выделяем самую затратную категорию жирным шрифтом
                 if stat['name'] == max_expense['name']:
@@ -325,13 +398,11 @@ class AnalyticsTab(QWidget):
                     name_label.setStyleSheet("color: #dc3545;")
                 else:
                     name_label.setFont(QFont("Arial", 9))
+                    name_label.setStyleSheet("")
+                row.show()
 
-                item_layout.addWidget(color_label)
-                item_layout.addWidget(name_label)
-                item_layout.addStretch()
-
-                layout.addLayout(item_layout)
-
-            layout.addStretch()
+            # Лишние строки прячем, а не удаляем
+            for row, _, _ in self.legend_rows[len(expense_stats):]:
+                row.hide()
         except Exception as e:
             print(f"Ошибка при обновлении легенды: {e}")
\ No newline at end of file
@@ -0,0 +1,212 @@
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+import ledger_generator
+from db_methods import DatabaseManager
+
+SIZES = (10_000, 100_000, 1_000_000, 10_000_000)  # число операций в тестовых БД
+REPEATS = 5  # сколько раз замеряем каждый метод
+SEED = 42
+BULK_SIZE = 1000  # операций в одном вызове add_operations_bulk при замере записи
+REGRESSION_THRESHOLD = 0.25  # допустимое замедление медианы относительно базового прогона (доля)
+MIN_REGRESSION_MS = 1.0  # разница меньше этой считается шумом
+FULL_LIST_LIMIT = 1_000_000  # get_all_operations читает весь журнал в память - на больших БД не замеряем
+
+LEDGER_END = ledger_generator.END  # журнал заканчивается фиксированной датой, чтобы прогоны были сравнимы
+LEDGER_YEARS = 3
+
+
+def month_start(day: date, months_back: int = 0):
+    """ Первое число месяца, отстоящего от day на months_back месяцев назад """
+    index = day.year * 12 + day.month - 1 - months_back
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def build_ledger(db_path: str, operations: int, seed: int = SEED):
+    """ Тестовая БД генератора ledger_generator (журнал за LEDGER_YEARS лет до LEDGER_END) """
+    ledger_generator.generate(db_path, operations, seed, LEDGER_YEARS, LEDGER_END)
+
+
+def read_benchmarks():
+    """ Замеры чтения: (название, функция от DatabaseManager, максимальный размер БД или None) """
+    last_day = LEDGER_END.isoformat()
+    last_month = month_start(LEDGER_END).isoformat()
+    year_start = (LEDGER_END - timedelta(days=364)).isoformat()
+    all_start = ledger_generator.ledger_start(LEDGER_END, LEDGER_YEARS).isoformat()
+    overview_start = month_start(LEDGER_END, 5).isoformat()
+    return [
+        ("get_all_operations", lambda m: m.get_all_operations(), FULL_LIST_LIMIT),
+        ("get_all_operations[expense]", lambda m: m.get_all_operations("expense"), FULL_LIST_LIMIT),
+        ("get_operations_page", lambda m: m.get_operations_page(None, 200), None),
+        ("get_operations_page[amount]", lambda m: m.get_operations_page(None, 200, None, ('amount', True)), None),
+        ("get_operations_page[filtered]",
+         lambda m: m.get_operations_page(None, 200, {'type': 'expense', 'date_from': last_month,
+                                                     'date_to': last_day, 'amount_min': 1000}), None),
+        ("search_operations", lambda m: m.search_operations("такси"), None),
+        ("get_financial_summary[month]", lambda m: m.get_financial_summary(last_month, last_day), None),
+        ("get_financial_summary[all]", lambda m: m.get_financial_summary(all_start, last_day), None),
+        ("get_expense_statistics[all]", lambda m: m.get_expense_statistics(all_start, last_day), None),
+        ("get_income_expense_by_period[day]",
+         lambda m: m.get_income_expense_by_period(last_month, last_day, 'day'), None),
+        ("get_income_expense_by_period[month]",
+         lambda m: m.get_income_expense_by_period(year_start, last_day, 'month'), None),
+        ("get_balance_as_of", lambda m: m.get_balance_as_of(last_day), None),
+        ("get_budget_limits", lambda m: m.get_budget_limits(last_month), None),
+        ("get_budget_overview", lambda m: m.get_budget_overview(overview_start, last_month), None),
+    ]
+
+
+def measure(function, repeats: int, prepare=None):
+    """ Медиана, минимум и максимум времени вызова в миллисекундах """
+    timings = []
+    for _ in range(repeats):
+        if prepare is not None:
+            prepare()
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        'median_ms': round(statistics.median(timings), 3),
+        'min_ms': round(min(timings), 3),
+        'max_ms': round(max(timings), 3),
+        'repeats': repeats,
+    }
+
+
+def run_size(db_path: str, operations: int, repeats: int, seed: int = SEED):
+    """ Замеры всех методов на одной БД (запись идет последней, чтобы не влиять на чтение) """
+    manager = DatabaseManager(db_path)
+    results = {}
+    try:
+        rng = random.Random(seed)
+        expense = [category['id'] for category in manager.get_categories('expense')]
+        for name, function, max_operations in read_benchmarks():
+            if max_operations is not None and operations > max_operations:
+                continue
+            # кэш сбрасываем перед каждым вызовом - замеряем сам запрос, а не попадание в кэш
+            results[name] = measure(lambda: function(manager), repeats, manager.clear_cache)
+
+        def add_operation():
+            manager.add_operation(round(rng.uniform(50, 5000), 2), rng.choice(expense),
+                                  LEDGER_END.isoformat(), "замер")
+
+        def add_operations_bulk():
+            manager.add_operations_bulk([(LEDGER_END.isoformat(), rng.choice(expense), "замер",
+                                          round(rng.uniform(50, 5000), 2), 'expense')
+                                         for _ in range(BULK_SIZE)])
+
+        results["add_operation"] = measure(add_operation, repeats)
+        results[f"add_operations_bulk[{BULK_SIZE}]"] = measure(add_operations_bulk, repeats)
+    finally:
+        manager.close()
+    return results
+
+
+def run(sizes=SIZES, repeats: int = REPEATS, seed: int = SEED, data_dir: str = None):
+    """ Прогон на всех размерах. data_dir - где хранить созданные БД между прогонами (иначе временная папка) """
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'seed': seed,
+            'repeats': repeats,
+        },
+        'results': {},
+    }
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for operations in sizes:
+            db_path = os.path.join(temp_dir, f"ledger_{operations}.db")
+            if data_dir:
+                # готовая БД копируется, потому что замеры записи её меняют
+                source = os.path.join(data_dir, f"ledger_{operations}_{seed}.db")
+                if not os.path.exists(source):
+                    print(f"Создание тестовой БД: {operations} операций")
+                    build_ledger(source, operations, seed)
+                copy_database(source, db_path)
+            else:
+                print(f"Создание тестовой БД: {operations} операций")
+                build_ledger(db_path, operations, seed)
+            print(f"Замеры: {operations} операций")
+            report['results'][str(operations)] = run_size(db_path, operations, repeats, seed)
+    return report
+
+
+def copy_database(source: str, target: str):
+    """ Копия БД через backup API (учитывает незавершенный WAL) """
+    source_conn = sqlite3.connect(source)
+    target_conn = sqlite3.connect(target)
+    try:
+        source_conn.backup(target_conn)
+    finally:
+        target_conn.close()
+        source_conn.close()
+
+
+def find_regressions(report: dict, baseline: dict, threshold: float = REGRESSION_THRESHOLD,
+                     min_delta_ms: float = MIN_REGRESSION_MS):
+    """ Методы, медиана которых выросла больше чем на threshold относительно базового прогона """
+    regressions = []
+    for size, methods in report['results'].items():
+        for name, result in methods.items():
+            base = baseline.get('results', {}).get(size, {}).get(name)
+            if base is None:
+                continue
+            delta = result['median_ms'] - base['median_ms']
+            if delta > min_delta_ms and delta > base['median_ms'] * threshold:
+                regressions.append(f"{size} операций, {name}: {base['median_ms']:.2f} мс -> "
+                                   f"{result['median_ms']:.2f} мс (+{delta / base['median_ms'] * 100:.0f}%)")
+    return regressions
+
+
+def format_report(report: dict):
+    """ Таблица результатов для вывода в консоль """
+    lines = []
+    for size, methods in report['results'].items():
+        lines.append(f"{size} операций:")
+        width = max(len(name) for name in methods)
+        for name, result in methods.items():
+            lines.append(f"  {name:<{width}}  {result['median_ms']:10.2f} мс  (мин. {result['min_ms']:.2f})")
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Замеры скорости DatabaseManager на синтетических БД")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES), help="число операций в тестовых БД")
+    parser.add_argument('--repeats', type=int, default=REPEATS, help="сколько раз замерять каждый метод")
+    parser.add_argument('--seed', type=int, default=SEED, help="зерно генератора тестовых данных")
+    parser.add_argument('--data-dir', help="папка для повторного использования созданных БД")
+    parser.add_argument('--output', help="файл для результатов в JSON")
+    parser.add_argument('--baseline', help="JSON прошлого прогона для сравнения")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help="допустимое замедление относительно базового прогона (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    if args.data_dir:
+        os.makedirs(args.data_dir, exist_ok=True)
+    report = run(args.sizes, args.repeats, args.seed, args.data_dir)
+    print(format_report(report))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as file:
+            baseline = json.load(file)
+        regressions = find_regressions(report, baseline, args.threshold)
+        if regressions:
+            print("Замедление относительно базового прогона:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("Замедлений относительно базового прогона нет")
@@ -0,0 +1,137 @@
+import threading
+from contextlib import contextmanager
+
+ALERT_THRESHOLDS = (70, 90, 100)  # проценты использования лимита, о пересечении которых сообщаем
+
+
+def budget_month(operation_date: str):
+    """ Месяц лимита (первое число), к которому относится дата операции в формате ISO """
+    return operation_date[:7] + "-01"
+
+
+class BudgetAlert:
+    """ Расходы категории за месяц перешли порог лимита """
+    def __init__(self, category_id: int, category_name: str, month: str, threshold: int,
+                 spent: float, limit: float):
+        self.category_id = category_id
+        self.category_name = category_name
+        self.month = month
+        self.threshold = threshold
+        self.spent = spent
+        self.limit = limit
+
+    def message(self):
+        if self.threshold >= 100:
+            return (f"Превышен лимит по категории «{self.category_name}» "
+                    f"({self.spent:.2f} ₽ из {self.limit:.2f} ₽)")
+        return (f"Израсходовано {self.threshold}% лимита по категории «{self.category_name}» "
+                f"({self.spent:.2f} ₽ из {self.limit:.2f} ₽)")
+
+    def __repr__(self):
+        return f"BudgetAlert({self.category_name!r}, {self.month!r}, {self.threshold}%)"
+
+
+class BudgetAlertEngine:
+    """ Проверка порогов лимитов при каждой записи операций
+
+    Текущие суммы расходов по (категория, месяц) уже поддерживаются триггерами в Operations_monthly,
+    поэтому проверка одной записи - это несколько поисков по первичному ключу, а не get_budget_limits.
+    Порядок: snapshot() до записи, check() после неё - сравниваются проценты "до" и "после".
+    """
+    def __init__(self, thresholds=ALERT_THRESHOLDS):
+        self.thresholds = tuple(sorted(thresholds))
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._local = threading.local()  # предупреждения, отложенные в collected()
+
+    def add_listener(self, callback):
+        """ callback(list[BudgetAlert]) - вызывается в потоке, который выполнил запись """
+        with self._lock:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        with self._lock:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    @contextmanager
+    def collected(self):
+        """ Предупреждения записей этого потока внутри блока рассылаются один раз в конце (импорт пачками)
+
+        Для каждой пары (месяц, категория) остается самый высокий пересеченный порог
+        """
+        pending = self._local.pending = {}
+        try:
+            yield
+        finally:
+            self._local.pending = None
+            if pending:
+                self._notify(sorted(pending.values(), key=lambda alert: (alert.month, alert.category_name)))
+
+    def enabled(self):
+        """ Есть ли кому сообщать (иначе проверки при записи не выполняются) """
+        with self._lock:
+            return bool(self._listeners)
+
+    def snapshot(self, conn, keys):
+        """ Лимит и расходы (в копейках) до записи для ключей (месяц, ID категории), у которых есть лимит """
+        if not self.enabled():
+            return {}
+        state = {}
+        for key in set(keys):
+            limit = self._limit(conn, *key)
+            if limit:
+                state[key] = (limit, self._spent_cents(conn, *key))
+        return state
+
+    def check(self, conn, state):
+        """ Сравниваем с расходами после записи и рассылаем предупреждения о пересеченных порогах """
+        alerts = []
+        if not state:
+            return alerts
+        for (month, category_id), (limit, spent_before) in state.items():
+            spent_after = self._spent_cents(conn, month, category_id)
+            threshold = self._crossed(spent_before / 100 / limit * 100, spent_after / 100 / limit * 100)
+            if threshold is not None:
+                row = conn.execute("SELECT name FROM Categories WHERE id = ?", (category_id,)).fetchone()
+                alerts.append(BudgetAlert(category_id, row[0] if row else "Неизвестно", month, threshold,
+                                          spent_after / 100, limit))
+        pending = getattr(self._local, 'pending', None)
+        if pending is not None:
+            for alert in alerts:
+                key = (alert.month, alert.category_id)
+                if key not in pending or alert.threshold >= pending[key].threshold:
+                    pending[key] = alert
+        elif alerts:
+            self._notify(alerts)
+        return alerts
+
+    def _notify(self, alerts):
+        with self._lock:
+            listeners = list(self._listeners)
+        for callback in listeners:
+            try:
+                callback(alerts)
+            except Exception as e:
+                print(f"Ошибка при обработке предупреждения о лимите: {e}")
+
+    def _crossed(self, percent_before, percent_after):
+        """ Самый высокий порог, который расходы пересекли снизу вверх (None - ни одного) """
+        crossed = [threshold for threshold in self.thresholds if percent_before < threshold <= percent_after]
+        return crossed[-1] if crossed else None
+
+    @staticmethod
+    def _limit(conn, month, category_id):
+        row = conn.execute("""
+            SELECT amount FROM Budget_limits
+            WHERE start_date = ? AND category_id = ?
+            AND end_date = date(start_date, '+1 month', '-1 day')""", (month, category_id)).fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def _spent_cents(conn, month, category_id):
+        row = conn.execute("""
+            SELECT total_cents FROM Operations_monthly
+            WHERE month = ? AND category_id = ? AND operation_type = 'expense'""",
+                           (month, category_id)).fetchone()
+        return row[0] if row else 0
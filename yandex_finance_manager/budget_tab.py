@@ -1,20 +1,78 @@
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel,
                              QComboBox, QTableWidget, QTableWidgetItem,
                              QPushButton, QHeaderView, QDialog, QLineEdit,
-                             QMessageBox, QProgressBar, QFrame, QAbstractItemView)
-from PyQt6.QtCore import Qt, QDate
+                             QMessageBox, QFrame, QAbstractItemView, QStyledItemDelegate,
+                             QStyleOptionViewItem, QStyle, QApplication)
+from PyQt6.QtCore import Qt, QDate, QRectF
 from PyQt6.QtGui import QFont, QColor, QPainter
 from PyQt6.QtCharts import QChart, QChartView, QBarSeries, QBarSet, QBarCategoryAxis, QValueAxis
 import db_methods
+from events import DataChange, DeferredRefreshMixin
+from query_runner import query_runner
+from charts import set_bar_values, set_axis_categories, fit_value_axis
 
+PROGRESS_COLUMN = 4
+# Пороги цвета прогресса (в процентах использования лимита)
+PROGRESS_WARNING = 70
+PROGRESS_DANGER = 90
+OVERVIEW_MONTHS = 6  # сколько месяцев (по выбранный включительно) показывает обзор
 
-class BudgetTab(QWidget):
+
+class BudgetProgressDelegate(QStyledItemDelegate):
+    """ Рисует полосу прогресса по проценту из данных ячейки, без виджета на каждую строку """
+    def __init__(self, parent=None, warning: float = PROGRESS_WARNING, danger: float = PROGRESS_DANGER):
+        super().__init__(parent)
+        self.warning = warning
+        self.danger = danger
+        self.colors = (QColor("#28a745"), QColor("#ffc107"), QColor("#dc3545"))
+        self.background = QColor("#e9ecef")
+
+    def color_for(self, percent):
+        """ Цвет полосы в зависимости от процента """
+        if percent < self.warning:
+            return self.colors[0]
+        if percent < self.danger:
+            return self.colors[1]
+        return self.colors[2]
+
+    def paint(self, painter, option, index):
+        percent = index.data(Qt.ItemDataRole.DisplayRole)
+        if percent is None:
+            super().paint(painter, option, index)
+            return
+
+        painter.save()
+        # фон ячейки (в том числе выделение) рисует стиль, полосу - мы
+        background = QStyleOptionViewItem(option)
+        self.initStyleOption(background, index)
+        background.text = ""
+        style = option.widget.style() if option.widget else QApplication.style()
+        style.drawControl(QStyle.ControlElement.CE_ItemViewItem, background, painter, option.widget)
+
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        rect = QRectF(option.rect).adjusted(4, 4, -4, -4)
+        painter.setPen(Qt.PenStyle.NoPen)
+        painter.setBrush(self.background)
+        painter.drawRoundedRect(rect, 3, 3)
+        if percent > 0:
+            filled = QRectF(rect)
+            filled.setWidth(rect.width() * min(percent, 100) / 100)
+            painter.setBrush(self.color_for(percent))
+            painter.drawRoundedRect(filled, 3, 3)
+
+        painter.setPen(QColor("#212529"))
+        painter.drawText(rect, Qt.AlignmentFlag.AlignCenter, f"{percent:.0f}%")
+        painter.restore()
+
+
+class BudgetTab(DeferredRefreshMixin, QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.parent = parent
         self.selected_limit_id = None
+        self.shown_category_ids = set()  # категории, по которым в таблице или обзоре есть лимиты
         self.initUI()
-        self.refresh_data()
+        self.data_dirty = True  # данные загрузятся при первом показе вкладки
 
     def initUI(self):
         main_layout = QVBoxLayout(self)
@@ -58,6 +116,13 @@ class BudgetTab(QWidget):
         period_layout.addWidget(self.period_combo)
         period_layout.addStretch()
 
+        # Индикатор фоновой загрузки лимитов
+        self.loading_label = QLabel("Загрузка...")
+        self.loading_label.setStyleSheet("color: #6c757d;")
+        self.loading_label.hide()
+        query_runner.busy_changed.connect(self.on_query_busy)
+        period_layout.addWidget(self.loading_label)
+
         layout.addLayout(period_layout)
 
     def create_budget_table(self, layout):
@@ -72,6 +137,10 @@ class BudgetTab(QWidget):
         self.budget_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
         self.budget_table.itemSelectionChanged.connect(self.on_row_selected)
 
+        # Прогресс рисует делегат по проценту в ячейке
+        self.progress_delegate = BudgetProgressDelegate(self.budget_table)
+        self.budget_table.setItemDelegateForColumn(PROGRESS_COLUMN, self.progress_delegate)
+
         layout.addWidget(self.budget_table)
 
     def create_buttons_panel(self, layout):
@@ -127,25 +196,121 @@ class BudgetTab(QWidget):
         self.bar_chart_view = QChartView()
         self.bar_chart_view.setRenderHint(QPainter.RenderHint.Antialiasing)
         self.bar_chart_view.setMinimumSize(400, 300)
+        self.bar_chart_view.setChart(self.create_bar_chart())
         chart_layout.addWidget(self.bar_chart_view)
 
-        bottom_layout.addWidget(chart_frame)
+        bottom_layout.addWidget(chart_frame, 1)
+
+        # Обзор: категории по строкам, месяцы по столбцам, в ячейке - процент использования лимита
+        overview_frame = QFrame()
+        overview_layout = QVBoxLayout(overview_frame)
+
+        overview_label = QLabel("Обзор по месяцам")
+        overview_label.setFont(QFont("Arial", 11, QFont.Weight.Bold))
+        overview_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        overview_layout.addWidget(overview_label)
+
+        self.overview_table = QTableWidget()
+        self.overview_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.overview_table.setSelectionMode(QAbstractItemView.SelectionMode.NoSelection)
+        self.overview_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        self.overview_table.setItemDelegate(BudgetProgressDelegate(self.overview_table))
+        overview_layout.addWidget(self.overview_table)
+
+        bottom_layout.addWidget(overview_frame, 1)
 
         layout.addLayout(bottom_layout)
 
+    def overview_months(self):
+        """ Первые числа месяцев обзора: OVERVIEW_MONTHS месяцев по выбранный включительно """
+        selected = QDate.fromString(self.period_combo.currentData(), "yyyy-MM-dd")
+        return [selected.addMonths(i - OVERVIEW_MONTHS + 1).toString("yyyy-MM-dd")
+                for i in range(OVERVIEW_MONTHS)]
+
+    def is_affected_by(self, change):
+        """ Лимиты месяцев обзора (по выбранный включительно) и расходы по их категориям """
+        if not change.touches('operation', 'budget_limit', 'category'):
+            return False
+        selected_month = self.period_combo.currentData()
+        if not selected_month:
+            return False
+        month_end = selected_month[:8] + "31"  # даты сравниваются как строки ISO
+        if not change.affects_dates(self.overview_months()[0], month_end):
+            return False
+        if change.entity == 'operation':
+            return change.affects_categories(self.shown_category_ids)
+        return True
+
+    def notify_data_changed(self, change):
+        """ Сообщаем главному окну об изменении лимитов """
+        if self.parent:
+            self.parent.notify_data_updated(change)
+        else:
+            self.apply_change(change)
+
+    def on_query_busy(self, key, busy):
+        if key == 'budget':
+            self.loading_label.setVisible(busy)
+
     def refresh_data(self):
-        """ Обновление данных на вкладке """
+        """ Обновление данных на вкладке (лимиты загружаются в фоне) """
         selected_month = self.period_combo.currentData()
         if not selected_month:
             return
+        months = self.overview_months()
+        query_runner.submit('budget', self.load_data, selected_month, months[0], months[-1],
+                            callback=self.show_data)
 
+    @staticmethod
+    def load_data(selected_month, first_month, last_month):
+        """ Лимиты выбранного месяца и обзор за несколько месяцев (выполняется в фоновом потоке) """
         budget_limits = db_methods.db_manager.get_budget_limits(selected_month)
-
-        self.budget_table.setRowCount(0)  # очищаем таблицу
-
-        # Заполняем таблицу
+        overview = db_methods.db_manager.get_budget_overview(first_month, last_month)
+        return budget_limits, overview
+
+    def show_data(self, result):
+        budget_limits, overview = result
+        self.show_budget_limits(budget_limits)
+        self.show_overview(overview)
+        self.shown_category_ids = ({limit['category_id'] for limit in budget_limits} |
+                                   {limit['category_id'] for limit in overview})
+
+    def show_overview(self, overview):
+        """ Заполняем сетку обзора: строка на категорию, столбец на месяц """
+        months = self.overview_months()
+        categories = list(dict.fromkeys(limit['category_name'] for limit in overview))  # в порядке запроса
+
+        self.overview_table.setUpdatesEnabled(False)
+        self.overview_table.clear()
+        self.overview_table.setColumnCount(len(months))
+        self.overview_table.setHorizontalHeaderLabels(
+            [QDate.fromString(month, "yyyy-MM-dd").toString("MM.yy") for month in months])
+        self.overview_table.setRowCount(len(categories))
+        self.overview_table.setVerticalHeaderLabels(categories)
+
+        rows = {name: row for row, name in enumerate(categories)}
+        columns = {month: column for column, month in enumerate(months)}
+        for limit in overview:
+            limit_amount = limit['limit_amount']
+            spent = limit['spent_amount']
+            if limit_amount > 0:
+                percent = spent / limit_amount * 100
+            else:
+                percent = 100 if spent > 0 else 0
+            item = QTableWidgetItem()
+            item.setData(Qt.ItemDataRole.DisplayRole, float(percent))
+            item.setToolTip(f"{spent:.2f} ₽ из {limit_amount:.2f} ₽")
+            self.overview_table.setItem(rows[limit['category_name']], columns[limit['month']], item)
+        self.overview_table.setUpdatesEnabled(True)
+
+    def show_budget_limits(self, budget_limits):
+        """ Заполняем таблицу и график загруженными лимитами """
+
+        # Заполняем таблицу одним проходом без перерисовки после каждой ячейки
+        self.budget_table.setUpdatesEnabled(False)
+        self.budget_table.clearContents()
+        self.budget_table.setRowCount(len(budget_limits))
         for row, limit in enumerate(budget_limits):
-            self.budget_table.insertRow(row)
             # Категория
             category_item = QTableWidgetItem(limit.get('category_name', 'Неизвестно'))
             # Сохраняем ID лимита в первый элемент строки
@@ -165,66 +330,33 @@ class BudgetTab(QWidget):
             if remaining < 0:
                 remaining_item.setForeground(QColor("#dc3545"))  # Красный если превышен лимит
             self.budget_table.setItem(row, 3, remaining_item)
-            # Прогресс-бар
-            progress_widget = QWidget()
-            progress_layout = QHBoxLayout(progress_widget)
-            progress_bar = QProgressBar()
 
             # Считаем процент использования
             if limit_amount > 0:
                 percent = min((spent / limit_amount) * 100, 100)
             else:
                 percent = 100 if spent > 0 else 0
-
-            progress_bar.setValue(int(percent))
-
-            # Цвет прогресс-бара в зависимости от процента
-            if percent < 70:
-                progress_bar.setStyleSheet("QProgressBar::chunk { background-color: #28a745; }")
-            elif percent < 90:
-                progress_bar.setStyleSheet("QProgressBar::chunk { background-color: #ffc107; }")
-            else:
-                progress_bar.setStyleSheet("QProgressBar::chunk { background-color: #dc3545; }")
-
-            progress_layout.addWidget(progress_bar)
-            progress_layout.setContentsMargins(2, 2, 2, 2)
-            self.budget_table.setCellWidget(row, 4, progress_widget)
+            progress_item = QTableWidgetItem()
+            progress_item.setData(Qt.ItemDataRole.DisplayRole, float(percent))
+            self.budget_table.setItem(row, PROGRESS_COLUMN, progress_item)
+        self.budget_table.setUpdatesEnabled(True)
 
         # Обновляем график
         self.update_bar_chart(budget_limits)
 
-    def update_bar_chart(self, budget_limits):
-        """ Обновление графика лимитов и расходов """
-        if not budget_limits:
-            # Если нет данных
-            chart = QChart()
-            chart.setTitle("Нет установленных лимитов")
-            self.bar_chart_view.setChart(chart)
-            return
-
+    def create_bar_chart(self):
+        """ График лимитов создается один раз, при обновлении меняются только данные """
         # Наборы данных для столбцов
-        limit_set = QBarSet("Лимит")
-        limit_set.setColor(QColor("#495057"))
-
-        spent_set = QBarSet("Потрачено")
-        spent_set.setColor(QColor("#adb5bd"))
-
-        categories = []
-
-        # Заполняем данные
-        for limit in budget_limits:
-            limit_amount = limit.get('limit_amount', 0)
-            spent_amount = limit.get('spent_amount', 0)
-            category_name = limit.get('category_name', 'Неизвестно')
+        self.limit_set = QBarSet("Лимит")
+        self.limit_set.setColor(QColor("#495057"))
 
-            limit_set.append(limit_amount)
-            spent_set.append(spent_amount)
-            categories.append(category_name)
+        self.spent_set = QBarSet("Потрачено")
+        self.spent_set.setColor(QColor("#adb5bd"))
 
         # Создаем серию столбцов
         series = QBarSeries()
-        series.append(limit_set)
-        series.append(spent_set)
+        series.append(self.limit_set)
+        series.append(self.spent_set)
 
         # Создаем и настраиваем график
         chart = QChart()
@@ -232,22 +364,35 @@ class BudgetTab(QWidget):
         chart.setAnimationOptions(QChart.AnimationOption.SeriesAnimations)
 
         # Настраиваем оси
-        axis_x = QBarCategoryAxis()
-        axis_x.append(categories)
-        chart.addAxis(axis_x, Qt.AlignmentFlag.AlignBottom)
-        series.attachAxis(axis_x)
+        self.axis_x = QBarCategoryAxis()
+        chart.addAxis(self.axis_x, Qt.AlignmentFlag.AlignBottom)
+        series.attachAxis(self.axis_x)
 
-        axis_y = QValueAxis()
-        axis_y.setTitleText("Рубли")
-        axis_y.setLabelFormat("%.0f")
-        chart.addAxis(axis_y, Qt.AlignmentFlag.AlignLeft)
-        series.attachAxis(axis_y)
+        self.axis_y = QValueAxis()
+        self.axis_y.setTitleText("Рубли")
+        self.axis_y.setLabelFormat("%.0f")
+        chart.addAxis(self.axis_y, Qt.AlignmentFlag.AlignLeft)
+        series.attachAxis(self.axis_y)
 
         # Настраиваем легенду
         chart.legend().setVisible(True)
         chart.legend().setAlignment(Qt.AlignmentFlag.AlignBottom)
+        return chart
 
-        self.bar_chart_view.setChart(chart)
+    def update_bar_chart(self, budget_limits):
+        """ Обновление графика лимитов и расходов """
+        chart = self.bar_chart_view.chart()
+        # Если нет данных
+        chart.setTitle("" if budget_limits else "Нет установленных лимитов")
+
+        limits = [limit.get('limit_amount', 0) for limit in budget_limits]
+        spent = [limit.get('spent_amount', 0) for limit in budget_limits]
+        categories = [limit.get('category_name', 'Неизвестно') for limit in budget_limits]
+
+        set_bar_values(self.limit_set, limits)
+        set_bar_values(self.spent_set, spent)
+        set_axis_categories(self.axis_x, categories)
+        fit_value_axis(self.axis_y, limits, spent)
 
     def on_row_selected(self):
         """ Обработка выбора строки в таблице """
@@ -270,7 +415,7 @@ class BudgetTab(QWidget):
         selected_month = self.period_combo.currentData()
         dialog = BudgetLimitDialog(self, selected_month)
         if dialog.exec() == QDialog.DialogCode.Accepted:
-            self.refresh_data()
+            self.notify_data_changed(DataChange('budget_limit', 'insert', dates=[selected_month]))
 
     def show_edit_dialog(self):
         """ Диалог редактирования лимита """
@@ -281,17 +426,13 @@ class BudgetTab(QWidget):
         selected_month = self.period_combo.currentData()
 
         # Находим данные выбранного лимита
-        budget_limits = db_methods.db_manager.get_budget_limits(selected_month)
-        limit_data = None
-        for limit in budget_limits:
-            if limit.get('id') == self.selected_limit_id:
-                limit_data = limit
-                break
+        limit_data = db_methods.db_manager.get_budget_limit_by_id(self.selected_limit_id)
 
         if limit_data:
             dialog = BudgetLimitDialog(self, selected_month, limit_data)
             if dialog.exec() == QDialog.DialogCode.Accepted:
-                self.refresh_data()
+                self.notify_data_changed(DataChange('budget_limit', 'update', [limit_data['id']],
+                                                    dates=[selected_month]))
         else:
             QMessageBox.warning(self, 'Ошибка', 'Не удалось найти данные лимита')
 
@@ -307,11 +448,13 @@ class BudgetTab(QWidget):
                                      QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
 
         if reply == QMessageBox.StandardButton.Yes:
-            success = db_methods.db_manager.delete_budget_limit(self.selected_limit_id)
+            limit_id = self.selected_limit_id
+            success = db_methods.db_manager.delete_budget_limit(limit_id)
             if success:
                 QMessageBox.information(self, 'Успех', 'Лимит удален')
                 self.selected_limit_id = None
-                self.refresh_data()
+                self.notify_data_changed(DataChange('budget_limit', 'delete', [limit_id],
+                                                    dates=[self.period_combo.currentData()]))
             else:
                 QMessageBox.warning(self, 'Ошибка', 'Не удалось удалить лимит')
 
@@ -411,18 +554,28 @@ class BudgetLimitDialog(QDialog):
             QMessageBox.warning(self, 'Ошибка', 'Выберите категорию')
             return
 
+        # Лимит на категорию и месяц может быть только один
+        limit_id = self.limit_data['id'] if self.limit_data else None
+        existing = db_methods.db_manager.find_budget_limit(category_id, self.month_year)
+        if existing and existing['id'] != limit_id:
+            message = (f'У категории «{self.category_combo.currentText()}» уже есть лимит на этот месяц '
+                       f'({existing["limit_amount"]:.2f} ₽).')
+            if limit_id is not None:
+                QMessageBox.warning(self, 'Лимит уже есть', message + ' Измените или удалите его.')
+                return
+            reply = QMessageBox.question(self, 'Лимит уже есть', message + ' Заменить его?',
+                                         QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+            if reply != QMessageBox.StandardButton.Yes:
+                return
+            limit_id = existing['id']  # новая сумма записывается в найденный лимит
+
         # Сохраняем в базу данных
-        if not self.limit_data:
+        if limit_id is None:
             success = db_methods.db_manager.add_budget_limit(
                 category_id, amount, self.month_year)
         else:
-            if hasattr(db_methods.db_manager, 'update_budget_limit'):
-                success = db_methods.db_manager.update_budget_limit(
-                        self.limit_data['id'], category_id, amount, self.month_year)
-            else:
-                db_methods.db_manager.delete_budget_limit(self.limit_data['id'])
-                success = db_methods.db_manager.add_budget_limit(
-                    category_id, amount, self.month_year)
+            success = db_methods.db_manager.update_budget_limit(
+                limit_id, category_id, amount, self.month_year)
 
         if success:
             self.accept()
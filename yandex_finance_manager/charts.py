@@ -0,0 +1,27 @@
+from PyQt6.QtCharts import QBarSet, QValueAxis, QBarCategoryAxis
+
+
+def set_bar_values(bar_set: QBarSet, values):
+    """ Заменяем значения набора на месте: сам набор, его серия и оси остаются прежними """
+    values = [float(value) for value in values]
+    count = bar_set.count()
+    for i in range(min(count, len(values))):
+        if bar_set.at(i) != values[i]:
+            bar_set.replace(i, values[i])
+    if count > len(values):
+        bar_set.remove(len(values), count - len(values))
+    elif len(values) > count:
+        bar_set.append(values[count:])
+
+
+def set_axis_categories(axis: QBarCategoryAxis, categories):
+    """ Подписи оси меняем только если они действительно изменились """
+    if axis.categories() != list(categories):
+        axis.setCategories(list(categories))
+
+
+def fit_value_axis(axis: QValueAxis, *value_lists):
+    """ Диапазон оси под новые данные (у постоянного графика он сам не пересчитывается) """
+    maximum = max((max(values) for values in value_lists if values), default=0)
+    axis.setRange(0, maximum if maximum > 0 else 1)
+    axis.applyNiceNumbers()
@@ -1,9 +1,22 @@
 import sqlite3
 
-def init_database():
-    conn = sqlite3.connect('finance_manager.db')
-    cursor = conn.cursor()
+DB_PATH = 'finance_manager.db'
+
+DEFAULT_CATEGORIES = [
+    ('Зарплата', 'income'),
+    ('Премия', 'income'),
+    ('Инвестиции', 'income'),
+    ('Еда', 'expense'),
+    ('Транспорт', 'expense'),
+    ('Развлечения', 'expense'),
+    ('Коммунальные услуги', 'expense'),
+    ('Здоровье', 'expense'),
+    ('Одежда', 'expense'),
+    ('Образование', 'expense')]
+
 
+def migration_1_initial_schema(cursor):
+    """ Базовые таблицы и категории по умолчанию """
     cursor.execute("""CREATE TABLE IF NOT EXISTS Categories (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
                         name TEXT NOT NULL UNIQUE,
@@ -28,26 +41,348 @@ def init_database():
                         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                         FOREIGN KEY (category_id) REFERENCES categories(id) ON DELETE CASCADE)""")
 
-    default_categories = [
-        ('Зарплата', 'income'),
-        ('Премия', 'income'),
-        ('Инвестиции', 'income'),
-        ('Еда', 'expense'),
-        ('Транспорт', 'expense'),
-        ('Развлечения', 'expense'),
-        ('Коммунальные услуги', 'expense'),
-        ('Здоровье', 'expense'),
-        ('Одежда', 'expense'),
-        ('Образование', 'expense')]
-
-    for name, category_type in default_categories:
+    # если категория уже есть - пропускаем
+    cursor.executemany("""INSERT OR IGNORE INTO Categories (name, category_type) VALUES (?, ?)""",
+                       DEFAULT_CATEGORIES)
+
+
+def migration_2_operation_indexes(cursor):
+    """ Индексы под запросы из db_methods.py """
+    # get_financial_summary, get_expense_statistics: фильтр по типу и диапазону дат,
+    # category_id и amount лежат в индексе, поэтому таблицу читать не нужно
+    cursor.execute("""CREATE INDEX IF NOT EXISTS idx_operations_type_date
+                      ON Operations (operation_type, operation_date, category_id, amount)""")
+
+    # get_income_expense_by_period и сортировка get_all_operations по дате
+    cursor.execute("""CREATE INDEX IF NOT EXISTS idx_operations_date
+                      ON Operations (operation_date, operation_type, amount)""")
+
+    # get_budget_limits: сумма по категории за период лимита
+    cursor.execute("""CREATE INDEX IF NOT EXISTS idx_operations_category_date
+                      ON Operations (category_id, operation_date, amount)""")
+
+    # get_budget_limits: поиск лимитов месяца
+    cursor.execute("""CREATE INDEX IF NOT EXISTS idx_budget_limits_period
+                      ON Budget_limits (start_date, end_date, category_id)""")
+
+    cursor.execute("ANALYZE")
+
+
+def migration_3_operation_keyset_indexes(cursor):
+    """ Индексы для постраничной выборки операций по (operation_date, id) """
+    cursor.execute("""CREATE INDEX IF NOT EXISTS idx_operations_date_id
+                      ON Operations (operation_date, id)""")
+    cursor.execute("""CREATE INDEX IF NOT EXISTS idx_operations_type_date_id
+                      ON Operations (operation_type, operation_date, id)""")
+    cursor.execute("ANALYZE")
+
+
+# Таблицы агрегатов и выражения для их ключа
+ROLLUPS = (('Operations_daily', 'day'), ('Operations_monthly', 'month'))
+ROLLUP_KEYS = {
+    'day': "date({row}.operation_date)",
+    'month': "strftime('%Y-%m-01', {row}.operation_date)",
+}
+# Сумма операции в копейках; ROUND(amount, 2) округляет по десятичной записи (0.145 -> 0.15)
+AMOUNT_CENTS = "CAST(ROUND(ROUND({row}.amount, 2) * 100) AS INTEGER)"
+
+
+def rebuild_rollups(cursor):
+    """ Полный пересчет агрегатов по таблице Operations """
+    cursor.execute("DELETE FROM Operations_daily")
+    cursor.execute("DELETE FROM Operations_monthly")
+    cursor.execute(f"""INSERT INTO Operations_daily (day, category_id, operation_type, total_cents, operations_count)
+                      SELECT date(operation_date), category_id, operation_type,
+                             SUM({AMOUNT_CENTS.format(row='Operations')}), COUNT(*)
+                      FROM Operations
+                      GROUP BY date(operation_date), category_id, operation_type""")
+    cursor.execute("""INSERT INTO Operations_monthly (month, category_id, operation_type, total_cents, operations_count)
+                      SELECT strftime('%Y-%m-01', day), category_id, operation_type,
+                             SUM(total_cents), SUM(operations_count)
+                      FROM Operations_daily
+                      GROUP BY strftime('%Y-%m-01', day), category_id, operation_type""")
+
+
+def create_rollup_triggers(cursor):
+    """ Триггеры, которые поддерживают агрегаты при изменении Operations """
+    for table, key in ROLLUPS:
+        add_new = f"""
+            INSERT INTO {table} ({key}, category_id, operation_type, total_cents, operations_count)
+            VALUES ({ROLLUP_KEYS[key].format(row='NEW')}, NEW.category_id, NEW.operation_type,
+                    {AMOUNT_CENTS.format(row='NEW')}, 1)
+            ON CONFLICT ({key}, category_id, operation_type) DO UPDATE
+            SET total_cents = total_cents + excluded.total_cents,
+                operations_count = operations_count + 1;"""
+        remove_old = f"""
+            UPDATE {table}
+            SET total_cents = total_cents - {AMOUNT_CENTS.format(row='OLD')},
+                operations_count = operations_count - 1
+            WHERE {key} = {ROLLUP_KEYS[key].format(row='OLD')}
+              AND category_id = OLD.category_id AND operation_type = OLD.operation_type;
+            DELETE FROM {table}
+            WHERE {key} = {ROLLUP_KEYS[key].format(row='OLD')}
+              AND category_id = OLD.category_id AND operation_type = OLD.operation_type
+              AND operations_count <= 0;"""
+
+        cursor.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_{table.lower()}_insert
+                           AFTER INSERT ON Operations BEGIN {add_new} END""")
+        cursor.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_{table.lower()}_delete
+                           AFTER DELETE ON Operations BEGIN {remove_old} END""")
+        cursor.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_{table.lower()}_update
+                           AFTER UPDATE OF operation_date, category_id, amount, operation_type ON Operations
+                           BEGIN {remove_old} {add_new} END""")
+
+
+def migration_4_rollup_tables(cursor):
+    """ Агрегаты по дням и месяцам (день/месяц × категория × тип), их поддерживают триггеры
+
+    Суммы хранятся в копейках (INTEGER), чтобы вычитание при удалении и изменении было точным
+    """
+    cursor.execute("""CREATE TABLE IF NOT EXISTS Operations_daily (
+                        day DATE NOT NULL,
+                        category_id INTEGER NOT NULL,
+                        operation_type TEXT NOT NULL,
+                        total_cents INTEGER NOT NULL,
+                        operations_count INTEGER NOT NULL,
+                        PRIMARY KEY (day, category_id, operation_type)) WITHOUT ROWID""")
+
+    cursor.execute("""CREATE TABLE IF NOT EXISTS Operations_monthly (
+                        month DATE NOT NULL,
+                        category_id INTEGER NOT NULL,
+                        operation_type TEXT NOT NULL,
+                        total_cents INTEGER NOT NULL,
+                        operations_count INTEGER NOT NULL,
+                        PRIMARY KEY (month, category_id, operation_type)) WITHOUT ROWID""")
+
+    create_rollup_triggers(cursor)
+    rebuild_rollups(cursor)
+
+
+SIGNED_CENTS = "CASE WHEN {row}.operation_type = 'income' THEN 1 ELSE -1 END * " + AMOUNT_CENTS
+CHECKPOINT_MONTH = "strftime('%Y-%m-01', {row}.operation_date)"
+
+
+def rebuild_balance_checkpoints(cursor):
+    """ Пересчет накопленного баланса на конец каждого месяца по месячным агрегатам """
+    cursor.execute("DELETE FROM Balance_checkpoints")
+    cursor.execute("""INSERT INTO Balance_checkpoints (month, balance_cents)
+                      SELECT month, SUM(SUM(CASE WHEN operation_type = 'income' THEN total_cents
+                                                 ELSE -total_cents END)) OVER (ORDER BY month)
+                      FROM Operations_monthly
+                      GROUP BY month""")
+
+
+def migration_5_balance_checkpoints(cursor):
+    """ Контрольные точки баланса: накопленный баланс на конец каждого месяца с операциями
+
+    Баланс на любую дату = последняя точка до начала месяца + операции этого месяца до даты
+    """
+    cursor.execute("""CREATE TABLE IF NOT EXISTS Balance_checkpoints (
+                        month DATE PRIMARY KEY,
+                        balance_cents INTEGER NOT NULL) WITHOUT ROWID""")
+
+    def shift(row, sign):
+        month = CHECKPOINT_MONTH.format(row=row)
+        return f"""
+            UPDATE Balance_checkpoints
+            SET balance_cents = balance_cents {sign} {SIGNED_CENTS.format(row=row)}
+            WHERE month >= {month};"""
+
+    # точка для нового месяца начинается с баланса предыдущей
+    add_checkpoint = f"""
+        INSERT OR IGNORE INTO Balance_checkpoints (month, balance_cents)
+        VALUES ({CHECKPOINT_MONTH.format(row='NEW')},
+                COALESCE((SELECT balance_cents FROM Balance_checkpoints
+                          WHERE month < {CHECKPOINT_MONTH.format(row='NEW')}
+                          ORDER BY month DESC LIMIT 1), 0));"""
+
+    cursor.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_balance_checkpoints_insert
+                       AFTER INSERT ON Operations BEGIN {add_checkpoint} {shift('NEW', '+')} END""")
+    cursor.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_balance_checkpoints_delete
+                       AFTER DELETE ON Operations BEGIN {shift('OLD', '-')} END""")
+    cursor.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_balance_checkpoints_update
+                       AFTER UPDATE OF operation_date, amount, operation_type ON Operations
+                       BEGIN {shift('OLD', '-')} {add_checkpoint} {shift('NEW', '+')} END""")
+
+    rebuild_balance_checkpoints(cursor)
+
+
+def migration_6_budget_overview_index(cursor):
+    """ Покрывающий индекс лимитов по месяцу и категории для обзора бюджета за несколько месяцев
+
+    Расходы по лимитам берутся из Operations_monthly по его первичному ключу (month, category_id, operation_type)
+    """
+    cursor.execute("DROP INDEX IF EXISTS idx_budget_limits_period")
+    cursor.execute("""CREATE INDEX IF NOT EXISTS idx_budget_limits_month_category
+                      ON Budget_limits (start_date, category_id, end_date, amount)""")
+    cursor.execute("ANALYZE Budget_limits")
+
+
+def migration_7_operations_fts(cursor):
+    """ Полнотекстовый поиск по описаниям операций (FTS5 с внешним содержимым из Operations)
+
+    Индекс хранит только токены, сами описания остаются в Operations; триггеры держат его в актуальном состоянии.
+    FTS5 сбрасывает накопленные изменения на диск при каждом срабатывании триггера, поэтому пакетная вставка
+    (add_operations_bulk) выставляет Operations_fts_state.deferred = 1 и индексирует всю пачку одним запросом
+    """
+    cursor.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS Operations_fts USING fts5(
+                        description,
+                        content='Operations', content_rowid='id',
+                        tokenize='unicode61 remove_diacritics 2', prefix='2 3')""")
+
+    cursor.execute("""CREATE TABLE IF NOT EXISTS Operations_fts_state (
+                        id INTEGER PRIMARY KEY CHECK (id = 1),
+                        deferred INTEGER NOT NULL DEFAULT 0)""")
+    cursor.execute("INSERT OR IGNORE INTO Operations_fts_state (id, deferred) VALUES (1, 0)")
+
+    cursor.execute("""CREATE TRIGGER IF NOT EXISTS trg_operations_fts_insert AFTER INSERT ON Operations
+                      WHEN (SELECT deferred FROM Operations_fts_state WHERE id = 1) = 0
+                      BEGIN
+                          INSERT INTO Operations_fts (rowid, description) VALUES (NEW.id, NEW.description);
+                      END""")
+    # для внешнего содержимого удаление из индекса - это специальная команда 'delete' со старым текстом
+    cursor.execute("""CREATE TRIGGER IF NOT EXISTS trg_operations_fts_delete AFTER DELETE ON Operations
+                      BEGIN
+                          INSERT INTO Operations_fts (Operations_fts, rowid, description)
+                          VALUES ('delete', OLD.id, OLD.description);
+                      END""")
+    cursor.execute("""CREATE TRIGGER IF NOT EXISTS trg_operations_fts_update AFTER UPDATE OF description ON Operations
+                      BEGIN
+                          INSERT INTO Operations_fts (Operations_fts, rowid, description)
+                          VALUES ('delete', OLD.id, OLD.description);
+                          INSERT INTO Operations_fts (rowid, description) VALUES (NEW.id, NEW.description);
+                      END""")
+
+    # индексируем уже существующие операции
+    cursor.execute("INSERT INTO Operations_fts (Operations_fts) VALUES ('rebuild')")
+
+
+def migration_8_operation_amount_indexes(cursor):
+    """ Индексы для сортировки списка операций по сумме (keyset-пагинация по (amount, id)) """
+    cursor.execute("""CREATE INDEX IF NOT EXISTS idx_operations_amount_id
+                      ON Operations (amount, id)""")
+    # то же при фильтре по типу операции
+    cursor.execute("""CREATE INDEX IF NOT EXISTS idx_operations_type_amount_id
+                      ON Operations (operation_type, amount, id)""")
+    cursor.execute("ANALYZE Operations")
+
+
+def migration_9_unique_budget_limits(cursor):
+    """ Один лимит на категорию и период
+
+    Если у категории на один период несколько лимитов, остается последний добавленный (с наибольшим ID),
+    остальные удаляются; каждый удаленный лимит выводится в консоль
+    """
+    removed = cursor.execute("""SELECT id, category_id, start_date, end_date, amount FROM Budget_limits
+                                WHERE id NOT IN (SELECT MAX(id) FROM Budget_limits
+                                                 GROUP BY category_id, start_date, end_date)
+                                ORDER BY start_date, category_id, id""").fetchall()
+    for limit_id, category_id, start_date, end_date, amount in removed:
+        print(f"Удален повторный бюджетный лимит {limit_id}: категория {category_id}, "
+              f"{start_date} - {end_date}, {amount} (оставлен последний добавленный лимит)")
+    cursor.execute("""DELETE FROM Budget_limits
+                      WHERE id NOT IN (SELECT MAX(id) FROM Budget_limits
+                                       GROUP BY category_id, start_date, end_date)""")
+    cursor.execute("""CREATE UNIQUE INDEX IF NOT EXISTS idx_budget_limits_unique_period
+                      ON Budget_limits (start_date, category_id, end_date)""")
+
+
+# Миграции применяются по порядку, номер версии схемы хранится в PRAGMA user_version
+MIGRATIONS = [
+    migration_1_initial_schema,
+    migration_2_operation_indexes,
+    migration_3_operation_keyset_indexes,
+    migration_4_rollup_tables,
+    migration_5_balance_checkpoints,
+    migration_6_budget_overview_index,
+    migration_7_operations_fts,
+    migration_8_operation_amount_indexes,
+    migration_9_unique_budget_limits,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_schema_version(conn):
+    """ Текущая версия схемы в файле БД """
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """ Применяем все недостающие миграции, каждую в своей транзакции """
+    version = get_schema_version(conn)
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(f"Версия БД ({version}) новее, чем поддерживает программа ({SCHEMA_VERSION})")
+
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        cursor = conn.cursor()
+        cursor.execute("BEGIN")
         try:
-            cursor.execute("""INSERT INTO Categories (name, category_type) VALUES (?, ?)""", (name, category_type))
-        except sqlite3.IntegrityError:
-            pass  # если категория уже есть - пропускаем
+            migration(cursor)
+            cursor.execute(f"PRAGMA user_version = {number}")
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+    return get_schema_version(conn)
+
+
+def repair_deferred_fts(conn):
+    """ Перестраиваем поисковый индекс, если пакетная вставка оборвалась с Operations_fts_state.deferred = 1
+
+    Пока флаг выставлен, триггер не индексирует новые операции, поэтому индекс мог отстать от Operations
+    """
+    if conn.execute("SELECT deferred FROM Operations_fts_state WHERE id = 1").fetchone()[0] == 0:
+        return False
+    cursor = conn.cursor()
+    cursor.execute("BEGIN")
+    try:
+        cursor.execute("INSERT INTO Operations_fts (Operations_fts) VALUES ('rebuild')")
+        cursor.execute("UPDATE Operations_fts_state SET deferred = 0")
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+    return True
+
+
+def init_database(db_path: str = DB_PATH):
+    conn = sqlite3.connect(db_path, isolation_level=None)  # транзакциями управляем сами
+    try:
+        migrate(conn)
+        if repair_deferred_fts(conn):
+            print("Поисковый индекс операций перестроен после прерванной пакетной вставки")
+    finally:
+        conn.close()
+
+
+def rebuild_rollups_command(db_path: str = DB_PATH):
+    """ Пересчет агрегатов и точек баланса для существующей БД (если они разошлись с операциями) """
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        migrate(conn)
+        cursor = conn.cursor()
+        cursor.execute("BEGIN")
+        try:
+            rebuild_rollups(cursor)
+            rebuild_balance_checkpoints(cursor)
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
 
-    conn.commit()
-    conn.close()
 
 if __name__ == '__main__':
-    init_database()
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Создание и обслуживание БД финансового менеджера")
+    parser.add_argument('--db', default=DB_PATH, help="путь к файлу БД")
+    parser.add_argument('--rebuild-rollups', action='store_true', help="пересчитать агрегаты по дням и месяцам и точки баланса")
+    args = parser.parse_args()
+
+    if args.rebuild_rollups:
+        rebuild_rollups_command(args.db)
+    else:
+        init_database(args.db)
\ No newline at end of file
@@ -1,17 +1,209 @@
+import re
 import sqlite3
-from datetime import date
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+from functools import wraps
+from budget_alerts import BudgetAlertEngine, budget_month
+from db_trace import DatabaseTracer
+
+# Настройки соединения, которые выставляются один раз при открытии
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA mmap_size = 268435456",  # 256 МБ
+    "PRAGMA cache_size = -65536",  # 64 МБ
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA temp_store = MEMORY",
+)
+STATEMENT_CACHE_SIZE = 256
+QUERY_CACHE_SIZE = 256  # сколько результатов запросов храним в кэше
+CANCEL_CHECK_INTERVAL = 10000  # как часто (в инструкциях SQLite) проверять отмену фонового запроса
+# bm25 считается для каждого совпадения, поэтому при большем числе совпадений поиск сортирует по новизне
+RANKED_SEARCH_LIMIT = 5000
+
+# Группировка графика по периодам: подпись периода по дате {column} и шаг до следующего периода
+PERIOD_BUCKETS = {
+    'day': ("{column}", '+1 day'),
+    'week': ("date({column}, '-' || ((CAST(strftime('%w', {column}) AS INTEGER) + 6) % 7) || ' days')",
+             '+7 days'),  # неделя с понедельника, подпись - дата понедельника
+    'month': ("strftime('%Y-%m', {column})", '+1 month'),
+    'quarter': ("strftime('%Y', {column}) || '-Q' || ((CAST(strftime('%m', {column}) AS INTEGER) + 2) / 3)",
+                '+3 months'),
+    'year': ("strftime('%Y', {column})", '+1 year'),
+}
+MAX_CHART_BUCKETS = 31  # в режиме 'auto' выбирается самая мелкая группировка, дающая не больше столбцов
+
+
+def _freeze(value):
+    """ Аргументы запроса в виде, пригодном для ключа словаря """
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def cached_query(method):
+    """ Результат метода чтения кэшируется до ближайшей записи в БД
+
+    Возвращается тот же объект, что лежит в кэше, поэтому менять результат нельзя
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        key = (method.__name__, _freeze(args), _freeze(kwargs))
+        version = self._data_version()
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] == version:
+                self._cache.move_to_end(key)
+                self._cache_hits += 1
+                return entry[1]
+            self._cache_misses += 1
+
+        result = method(self, *args, **kwargs)
+        if self.is_cancelled():
+            # запрос прерван, результат неполный - в кэш его не кладем
+            return result
+        with self._cache_lock:
+            self._cache[key] = (version, result)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return result
+    return wrapper
+
+
+def invalidates_cache(method):
+    """ Метод записи: после него все закэшированные результаты устаревают """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            with self._cache_lock:
+                self._write_version += 1
+    return wrapper
 
 
 class DatabaseManager:
-    def __init__(self, db: str = "finance_manager.db"):
+    def __init__(self, db: str = "finance_manager.db", cache_size: int = QUERY_CACHE_SIZE):
         self.db = db
+        self._local = threading.local()  # у каждого потока своё соединение
+        self._connections = []
+        self._lock = threading.Lock()
+
+        # Кэш результатов запросов (LRU), действителен пока не изменилась версия данных
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._cache_lock = threading.Lock()
+        self._cache_hits = 0
+        self._cache_misses = 0
+        self._write_version = 0  # счетчик записей через этот DatabaseManager
+        self._external_version = 0  # счетчик замеченных изменений БД извне
+
+        # Предупреждения о пересечении порогов бюджетных лимитов при записи операций
+        self.budget_alerts = BudgetAlertEngine()
+
+        # Замеры методов и трассировка SQL (только если включены переменной окружения FINANCE_MANAGER_TRACE)
+        self.tracer = DatabaseTracer.from_environment()
+        if self.tracer is not None:
+            self.tracer.attach(self)
 
     def connection(self):
-        """ Соединение с БД """
-        conn = sqlite3.connect(self.db)
+        """ Соединение с БД (одно на поток, открывается при первом обращении) """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    def _connect(self):
+        # check_same_thread=False нужен только для close() из главного потока,
+        # запросы через соединение выполняет лишь поток, который его открыл
+        conn = sqlite3.connect(self.db, cached_statements=STATEMENT_CACHE_SIZE, check_same_thread=False)
         conn.row_factory = sqlite3.Row
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        if self.tracer is not None:
+            conn.set_trace_callback(self.tracer.trace)
+        with self._lock:
+            self._connections.append(conn)
         return conn
 
+    def close(self):
+        """ Закрываем все открытые соединения (вызывается при выходе из программы) """
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                print(f"Ошибка при закрытии соединения: {e}")
+        self._local = threading.local()
+        self.clear_cache()
+
+    def close_thread_connection(self):
+        """ Закрываем соединение текущего потока (вызывается в конце run() потоков импорта и экспорта) """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            return
+        self._local.conn = None
+        with self._lock:
+            if conn in self._connections:
+                self._connections.remove(conn)
+        try:
+            conn.close()
+        except sqlite3.Error as e:
+            print(f"Ошибка при закрытии соединения: {e}")
+
+    def set_cancel_event(self, cancel_event):
+        """ Прерывать запросы текущего потока, когда cancel_event установлен (None - не прерывать) """
+        self._local.cancel_event = cancel_event
+        if cancel_event is None:
+            self.connection().set_progress_handler(None, 0)
+        else:
+            # SQLite вызывает обработчик каждые N инструкций, ненулевой ответ прерывает запрос
+            self.connection().set_progress_handler(cancel_event.is_set, CANCEL_CHECK_INTERVAL)
+
+    def is_cancelled(self):
+        cancel_event = getattr(self._local, 'cancel_event', None)
+        return cancel_event is not None and cancel_event.is_set()
+
+    def _log_error(self, message: str, error: Exception):
+        """ Сообщение об ошибке запроса; прерванный отменой запрос (OperationalError 'interrupted') ошибкой не считается """
+        if isinstance(error, sqlite3.OperationalError) and self.is_cancelled():
+            return
+        print(f"{message}: {error}")
+
+    def _data_version(self):
+        """ Версия данных: наши записи + изменения через другие соединения (PRAGMA data_version) """
+        data_version = self.connection().execute("PRAGMA data_version").fetchone()[0]
+        last_seen = getattr(self._local, 'data_version', data_version)
+        self._local.data_version = data_version
+        with self._cache_lock:
+            if data_version != last_seen:
+                self._external_version += 1
+            return self._write_version, self._external_version
+
+    def clear_cache(self):
+        with self._cache_lock:
+            self._cache.clear()
+
+    def cache_stats(self):
+        """ Статистика кэша запросов для настройки его размера """
+        with self._cache_lock:
+            total = self._cache_hits + self._cache_misses
+            return {
+                'hits': self._cache_hits,
+                'misses': self._cache_misses,
+                'hit_rate': self._cache_hits / total if total else 0,
+                'size': len(self._cache),
+                'max_size': self._cache_size,
+                'write_version': self._write_version,
+            }
+
+    @cached_query
     def get_categories(self, category_type: str = None):
         try:
             with self.connection() as conn:
@@ -25,10 +217,25 @@ class DatabaseManager:
                 return [dict(row) for row in cursor.fetchall()]
 
         except Exception as e:  # Обрабатываем возможные ошибки
-            print(f"Ошибка при получении категорий: {e}")  # Выводим сообщение об ошибке
+            self._log_error("Ошибка при получении категорий", e)  # Выводим сообщение об ошибке
             return []  # Возвращаем пустой список в случае ошибки
 
+    @invalidates_cache
+    def get_or_create_category(self, name: str, category_type: str):
+        """ ID категории по имени, если её нет - создаем с указанным типом """
+        try:
+            with self.connection() as conn:
+                conn.execute("INSERT OR IGNORE INTO Categories (name, category_type) VALUES (?, ?)",
+                             (name, category_type))
+                row = conn.execute("SELECT id FROM Categories WHERE name = ?", (name,)).fetchone()
+                conn.commit()
+                return row['id']
+        except Exception as e:
+            self._log_error("Ошибка при создании категории", e)
+            return None
+
     # Методы для работы с операциями
+    @invalidates_cache
     def add_operation(self, amount: float, category_id: int, operation_date: str, description: str = ""):
         """ Добавление новой операции """
         try:
@@ -36,72 +243,372 @@ class DatabaseManager:
                 cursor = conn.execute("SELECT category_type FROM Categories WHERE id = ?", (category_id,))
                 result = cursor.fetchone()
                 operation_type = result['category_type']
+                alert_state = self._budget_snapshot(conn, [(operation_date, category_id, operation_type)])
                 cursor = conn.execute("""
                     INSERT INTO Operations (operation_date, category_id, description, amount, operation_type)
                     VALUES (?, ?, ?, ?, ?)""", (operation_date, category_id, description, amount, operation_type))
                 conn.commit()
+                self.budget_alerts.check(conn, alert_state)
                 return True
         except Exception as e:
-            print(f"Ошибка при добавлении операции: {e}")
+            self._log_error("Ошибка при добавлении операции", e)
+            return False
+
+    @invalidates_cache
+    def add_operations_bulk(self, operations):
+        """ Добавление пачки операций одной транзакцией
+
+        operations - кортежи (operation_date, category_id, description, amount, operation_type)
+        """
+        try:
+            with self.connection() as conn:
+                alert_state = self._budget_snapshot(
+                    conn, [(operation[0], operation[1], operation[4]) for operation in operations])
+                # поисковый индекс заполняем одним запросом после вставки, а не триггером на каждую строку
+                conn.execute("UPDATE Operations_fts_state SET deferred = 1")
+                try:
+                    last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM Operations").fetchone()[0]
+                    conn.executemany("""
+                        INSERT INTO Operations (operation_date, category_id, description, amount, operation_type)
+                        VALUES (?, ?, ?, ?, ?)""", operations)
+                    conn.execute("""
+                        INSERT INTO Operations_fts (rowid, description)
+                        SELECT id, description FROM Operations WHERE id > ?""", (last_id,))
+                finally:
+                    # флаг снимаем и при ошибке, не полагаясь только на откат транзакции
+                    conn.execute("UPDATE Operations_fts_state SET deferred = 0")
+                conn.commit()
+                self.budget_alerts.check(conn, alert_state)
+                return True
+        except Exception as e:
+            self._log_error("Ошибка при пакетном добавлении операций", e)
             return False
 
     def get_all_operations(self, filter_type: str = "all"):
         """ Получение всех операций с фильтрацией (все по умол.) """
         try:
-            query = """SELECT 
+            conditions, params = self._operations_filter({'type': filter_type})
+            query = self.OPERATIONS_SELECT
+            if conditions:
+                query += " WHERE " + " AND ".join(conditions)
+            query += " ORDER BY Operations.operation_date DESC, Operations.id DESC"
+
+            with self.connection() as conn:
+                cursor = conn.execute(query, params)
+                return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            self._log_error("Ошибка при загрузке операций", e)
+            return []
+
+    # Общая часть запросов к списку операций. CROSS JOIN фиксирует порядок соединения: Operations
+    # во внешнем цикле, иначе планировщик начинает с маленькой Categories и сортирует во временном B-дереве
+    OPERATIONS_SELECT = """SELECT 
                             Operations.id,
                             Operations.operation_date as date,
+                            Operations.category_id,
                             Categories.name as category_name,
                             Categories.category_type as category_type,
                             Operations.description,
                             Operations.amount,
                             Operations.operation_type
                        FROM Operations
-                       JOIN Categories ON Operations.category_id = Categories.id"""
+                       CROSS JOIN Categories ON Operations.category_id = Categories.id"""
+
+    def _operations_filter(self, filters: dict = None):
+        """ Условия WHERE для фильтров списка операций
+
+        Поддерживаемые ключи: type ('income'/'expense'/'all'), date_from, date_to, category_ids,
+        amount_min, amount_max
+        """
+        conditions = []
+        params = []
+        filters = filters or {}
+
+        operation_type = filters.get('type')
+        if operation_type in ('income', 'expense'):
+            conditions.append("Operations.operation_type = ?")
+            params.append(operation_type)
+        if filters.get('date_from'):
+            conditions.append("Operations.operation_date >= ?")
+            params.append(filters['date_from'])
+        if filters.get('date_to'):
+            conditions.append("Operations.operation_date <= ?")
+            params.append(filters['date_to'])
+        category_ids = filters.get('category_ids')
+        if category_ids:
+            conditions.append(f"Operations.category_id IN ({', '.join('?' * len(category_ids))})")
+            params.extend(category_ids)
+        if filters.get('amount_min') is not None:
+            conditions.append("Operations.amount >= ?")
+            params.append(filters['amount_min'])
+        if filters.get('amount_max') is not None:
+            conditions.append("Operations.amount <= ?")
+            params.append(filters['amount_max'])
+        return conditions, params
+
+    # Столбцы, по которым можно сортировать список операций: ключ -> (выражение, поле строки результата).
+    # К ключу всегда добавляется Operations.id, у каждого сочетания есть индекс (см. database.py)
+    OPERATIONS_SORT_KEYS = {
+        'date': (("Operations.operation_date", 'date'),),
+        'amount': (("Operations.amount", 'amount'),),
+        'type': (("Operations.operation_type", 'operation_type'), ("Operations.operation_date", 'date')),
+    }
 
-            if filter_type == "income":
-                query += " AND Operations.operation_type = 'income'"
-            elif filter_type == "expense":
-                query += " AND Operations.operation_type = 'expense'"
+    @cached_query
+    def get_operations_page(self, cursor: tuple = None, limit: int = 100, filters: dict = None,
+                            sort: tuple = ('date', True)):
+        """ Страница операций с keyset-пагинацией по (столбцы сортировки, id)
 
-            query += " ORDER BY Operations.operation_date DESC"
+        sort - (ключ из OPERATIONS_SORT_KEYS, по убыванию ли), по умолчанию новые сверху.
+        cursor - значения столбцов сортировки и id последней операции предыдущей страницы, None для первой.
+        Возвращает (операции, курсор следующей страницы или None, если это последняя страница)
+        """
+        try:
+            sort_key, descending = sort
+            columns = self.OPERATIONS_SORT_KEYS[sort_key] + (("Operations.id", 'id'),)
+            expressions = ", ".join(expression for expression, _ in columns)
+            direction = "DESC" if descending else "ASC"
+
+            conditions, params = self._operations_filter(filters)
+            if cursor is not None:
+                conditions.append(f"({expressions}) {'<' if descending else '>'} "
+                                  f"({', '.join('?' * len(columns))})")
+                params.extend(cursor)
+
+            query = self.OPERATIONS_SELECT
+            if conditions:
+                query += " WHERE " + " AND ".join(conditions)
+            # берем на одну строку больше, чтобы понять, есть ли следующая страница
+            query += " ORDER BY " + ", ".join(f"{expression} {direction}" for expression, _ in columns)
+            query += " LIMIT ?"
+            params.append(limit + 1)
 
             with self.connection() as conn:
-                cursor = conn.execute(query)
-                return [dict(row) for row in cursor.fetchall()]
+                operations = [dict(row) for row in conn.execute(query, params).fetchall()]
+
+            if len(operations) <= limit:
+                return operations, None
+            operations = operations[:limit]
+            last = operations[-1]
+            return operations, tuple(last[field] for _, field in columns)
         except Exception as e:
-            print(f"Ошибка при загрузке операций: {e}")
-            return []
+            self._log_error("Ошибка при загрузке страницы операций", e)
+            return [], None
+
+    @staticmethod
+    def _fts_query(text: str):
+        """ Запрос FTS5 из строки поиска: каждое слово - префикс, все слова обязательны """
+        words = re.findall(r"\w+", text)
+        # кавычки не дают словам вроде AND/OR/NEAR стать операторами FTS5
+        return " ".join(f'"{word}"*' for word in words)
+
+    @cached_query
+    def search_operations(self, query: str, filters: dict = None, cursor: int = None, limit: int = 100):
+        """ Поиск операций по словам в описании (FTS5), самые релевантные сверху
+
+        Если совпадений больше RANKED_SEARCH_LIMIT (слишком общий запрос), сверху самые новые операции.
+        filters - те же фильтры, что у get_operations_page. cursor - смещение страницы (None для первой).
+        Возвращает (операции, курсор следующей страницы или None, если это последняя страница)
+        """
+        try:
+            fts_query = self._fts_query(query)
+            if not fts_query:
+                return [], None
+            offset = cursor or 0
+
+            with self.connection() as conn:
+                matches = conn.execute("""
+                    SELECT COUNT(*) FROM (
+                        SELECT 1 FROM Operations_fts WHERE Operations_fts MATCH ? LIMIT ?)""",
+                                       (fts_query, RANKED_SEARCH_LIMIT + 1)).fetchone()[0]
+            if matches > RANKED_SEARCH_LIMIT:
+                order = "Operations_fts.rowid DESC"
+            else:
+                # при равной релевантности - новые сверху
+                order = "bm25(Operations_fts), Operations.operation_date DESC, Operations.id DESC"
+
+            conditions, params = self._operations_filter(filters)
+            conditions.insert(0, "Operations_fts MATCH ?")
+            params.insert(0, fts_query)
+
+            sql = self.OPERATIONS_SELECT.replace(
+                "FROM Operations", "FROM Operations_fts JOIN Operations ON Operations.id = Operations_fts.rowid", 1)
+            sql += " WHERE " + " AND ".join(conditions)
+            sql += f" ORDER BY {order} LIMIT ? OFFSET ?"
+            params.extend([limit + 1, offset])
+
+            with self.connection() as conn:
+                operations = [dict(row) for row in conn.execute(sql, params).fetchall()]
+
+            if len(operations) <= limit:
+                return operations, None
+            return operations[:limit], offset + limit
+        except Exception as e:
+            self._log_error("Ошибка при поиске операций", e)
+            return [], None
+
+    @cached_query
+    def count_operations(self, filters: dict = None):
+        """ Количество операций, подходящих под фильтры """
+        try:
+            conditions, params = self._operations_filter(filters)
+            query = "SELECT COUNT(*) FROM Operations"
+            if conditions:
+                query += " WHERE " + " AND ".join(conditions)
+            with self.connection() as conn:
+                return conn.execute(query, params).fetchone()[0]
+        except Exception as e:
+            self._log_error("Ошибка при подсчете операций", e)
+            return 0
+
+    def iter_operations(self, filters: dict = None, chunk_size: int = 1000):
+        """ Потоковый обход операций (старые сверху) порциями по chunk_size
+
+        В памяти одновременно держится только одна порция, ошибки пробрасываются вызывающему
+        """
+        conditions, params = self._operations_filter(filters)
+        query = self.OPERATIONS_SELECT
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY Operations.operation_date, Operations.id"
+
+        try:
+            cursor = self.connection().execute(query, params)
+            try:
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield [dict(row) for row in rows]
+            finally:
+                cursor.close()
+        except Exception as e:
+            self._log_error("Ошибка при выгрузке операций", e)
+            raise
+
+    @cached_query
+    def get_operation_by_id(self, operation_id: int):
+        """ Получение одной операции по ID (None, если не найдена) """
+        try:
+            with self.connection() as conn:
+                row = conn.execute(self.OPERATIONS_SELECT + " WHERE Operations.id = ?",
+                                   (operation_id,)).fetchone()
+                return dict(row) if row else None
+        except Exception as e:
+            self._log_error("Ошибка при загрузке операции", e)
+            return None
+
+    @invalidates_cache
+    def update_operation(self, operation_id: int, amount: float, category_id: int, operation_date: str,
+                         description: str = ""):
+        """ Изменение операции на месте (ID сохраняется) """
+        try:
+            with self.connection() as conn:
+                alert_state = {}
+                if self.budget_alerts.enabled():
+                    # старый и новый месяц/категория операции
+                    affected = self._stored_operations(conn, [operation_id])
+                    row = conn.execute("SELECT category_type FROM Categories WHERE id = ?", (category_id,)).fetchone()
+                    if row:
+                        affected.append((operation_date, category_id, row['category_type']))
+                    alert_state = self._budget_snapshot(conn, affected)
+                cursor = conn.execute("""
+                    UPDATE Operations
+                    SET operation_date = ?, category_id = ?, description = ?, amount = ?,
+                        operation_type = (SELECT category_type FROM Categories WHERE id = ?)
+                    WHERE id = ?""", (operation_date, category_id, description, amount, category_id, operation_id))
+                conn.commit()
+                self.budget_alerts.check(conn, alert_state)
+                return cursor.rowcount == 1
+        except Exception as e:
+            self._log_error("Ошибка при изменении операции", e)
+            return False
 
+    @invalidates_cache
     def delete_operation(self, operation_id: int):
         """ Удаление операции по ID """
         try:
+            # удаление только уменьшает расходы, пороги лимитов проверять не нужно
             with self.connection() as conn:
                 conn.execute("DELETE FROM Operations WHERE id = ?", (operation_id,))
                 conn.commit()
                 return True
         except Exception as e:
-            print(f"Ошибка при удалении операции: {e}")
+            self._log_error("Ошибка при удалении операции", e)
             return False
 
+    @staticmethod
+    def _stored_operations(conn, operation_ids):
+        """ (дата, категория, тип) сохраненных операций """
+        placeholders = ", ".join("?" * len(operation_ids))
+        rows = conn.execute(f"""SELECT operation_date, category_id, operation_type
+                                FROM Operations WHERE id IN ({placeholders})""", list(operation_ids))
+        return [tuple(row) for row in rows]
+
+    def _budget_snapshot(self, conn, operations):
+        """ Состояние лимитов до записи операций (дата, категория, тип) - сравнивается после записи """
+        if not self.budget_alerts.enabled():
+            return {}
+        keys = {(budget_month(operation_date), category_id)
+                for operation_date, category_id, operation_type in operations if operation_type == 'expense'}
+        return self.budget_alerts.snapshot(conn, keys)
+
     # Методы для аналитики
+    # Считаются по агрегатам Operations_daily/Operations_monthly (см. database.py), а не по самим операциям
+    def _rollup_source(self, start_date: str, end_date: str):
+        """ Подзапрос (day, category_id, operation_type, total_cents) по агрегатам за период
+
+        Полные месяцы берутся из месячных агрегатов (day = первое число месяца),
+        неполные месяцы по краям периода - из дневных
+        """
+        start = date.fromisoformat(start_date)
+        end = date.fromisoformat(end_date)
+
+        # первый и последний полные месяцы внутри периода
+        first_month = start if start.day == 1 else self._next_month(start)
+        if (end + timedelta(days=1)).day == 1:
+            last_month_end = end
+        else:
+            last_month_end = end.replace(day=1) - timedelta(days=1)
+        last_month = last_month_end.replace(day=1)
+
+        daily = """SELECT day, category_id, operation_type, total_cents
+                   FROM Operations_daily WHERE day BETWEEN ? AND ?"""
+        if first_month > last_month:
+            return daily, [start_date, end_date]
+
+        parts = ["""SELECT month AS day, category_id, operation_type, total_cents
+                    FROM Operations_monthly WHERE month BETWEEN ? AND ?"""]
+        params = [first_month.isoformat(), last_month.isoformat()]
+        if start < first_month:
+            parts.append(daily)
+            params.extend([start_date, (first_month - timedelta(days=1)).isoformat()])
+        if last_month_end < end:
+            parts.append(daily)
+            params.extend([self._next_month(last_month).isoformat(), end_date])
+        return " UNION ALL ".join(parts), params
+
+    @staticmethod
+    def _next_month(day: date):
+        """ Первое число следующего месяца """
+        if day.month == 12:
+            return date(day.year + 1, 1, 1)
+        return date(day.year, day.month + 1, 1)
+
+    @cached_query
     def get_financial_summary(self, start_date: str, end_date: str):
         """ Получение финансовой сводки за период """
         try:
+            source, params = self._rollup_source(start_date, end_date)
             with self.connection() as conn:
-                # Считаем доходы
-                income_cursor = conn.execute("""SELECT COALESCE(SUM(amount), 0) as total_income 
-                                          FROM Operations 
-                                          WHERE operation_type = 'income' AND operation_date BETWEEN ? AND ?""",
-                                             (start_date, end_date))
-                total_income = income_cursor.fetchone()['total_income']
-
-                # Считаем расходы
-                expense_cursor = conn.execute("""SELECT COALESCE(SUM(amount), 0) as total_expense 
-                                          FROM Operations 
-                                          WHERE operation_type = 'expense' AND operation_date BETWEEN ? AND ?""",
-                                              (start_date, end_date))
-                total_expense = expense_cursor.fetchone()['total_expense']
+                cursor = conn.execute(f"""
+                    SELECT 
+                        COALESCE(SUM(CASE WHEN operation_type = 'income' THEN total_cents END), 0) / 100.0 as total_income,
+                        COALESCE(SUM(CASE WHEN operation_type = 'expense' THEN total_cents END), 0) / 100.0 as total_expense
+                    FROM ({source})""", params)
+                totals = cursor.fetchone()
+                total_income = totals['total_income']
+                total_expense = totals['total_expense']
 
                 return {
                     'income': total_income,
@@ -109,52 +616,156 @@ class DatabaseManager:
                     'balance': total_income - total_expense
                 }
         except Exception as e:
-            print(f"Ошибка при получении финансовой сводки: {e}")
+            self._log_error("Ошибка при получении финансовой сводки", e)
             return {'income': 0, 'expense': 0, 'balance': 0}
 
+    @cached_query
+    def get_balance_as_of(self, day: str):
+        """ Баланс (доходы минус расходы) за всё время по указанную дату включительно
+
+        Берем точку баланса на конец предыдущего месяца и досчитываем дни текущего по дневным агрегатам
+        """
+        try:
+            month_start = date.fromisoformat(day).replace(day=1).isoformat()
+            with self.connection() as conn:
+                cursor = conn.execute("""
+                    SELECT 
+                        COALESCE((SELECT balance_cents FROM Balance_checkpoints
+                                  WHERE month < ? ORDER BY month DESC LIMIT 1), 0)
+                        + COALESCE((SELECT SUM(CASE WHEN operation_type = 'income' THEN total_cents
+                                                    ELSE -total_cents END)
+                                    FROM Operations_daily WHERE day BETWEEN ? AND ?), 0) as balance_cents
+                    """, (month_start, month_start, day))
+                return cursor.fetchone()['balance_cents'] / 100.0
+        except Exception as e:
+            self._log_error("Ошибка при получении баланса на дату", e)
+            return 0
+
+    @cached_query
+    def get_total_balance(self):
+        """ Баланс за всё время (включая операции с будущими датами) """
+        try:
+            with self.connection() as conn:
+                row = conn.execute("""SELECT balance_cents FROM Balance_checkpoints
+                                      ORDER BY month DESC LIMIT 1""").fetchone()
+                return row['balance_cents'] / 100.0 if row else 0
+        except Exception as e:
+            self._log_error("Ошибка при получении общего баланса", e)
+            return 0
+
+    @cached_query
     def get_expense_statistics(self, start_date: str, end_date: str):
         """ Получение статистики расходов по категориям"""
         try:
+            source, params = self._rollup_source(start_date, end_date)
             with self.connection() as conn:
-                cursor = conn.execute("""
-                    SELECT Categories.id, Categories.name, SUM(Operations.amount) as total
-                    FROM Operations
-                    JOIN Categories ON Operations.category_id = Categories.id
-                    WHERE Operations.operation_type = 'expense' AND Operations.operation_date BETWEEN ? AND ?
+                cursor = conn.execute(f"""
+                    SELECT Categories.id, Categories.name, SUM(rollup.total_cents) / 100.0 as total
+                    FROM ({source}) AS rollup
+                    JOIN Categories ON rollup.category_id = Categories.id
+                    WHERE rollup.operation_type = 'expense'
                     GROUP BY Categories.id, Categories.name
                     HAVING total > 0
-                    ORDER BY total DESC""", (start_date, end_date))
+                    ORDER BY total DESC""", params)
                 return [dict(row) for row in cursor.fetchall()]
         except Exception as e:
-            print(f"Ошибка при получении статистики расходов: {e}")
+            self._log_error("Ошибка при получении статистики расходов", e)
             return []
 
+    @staticmethod
+    def _bucket_start(day: date, group_by: str):
+        """ Первый день периода группировки, в который попадает дата """
+        if group_by == 'week':
+            return day - timedelta(days=day.weekday())
+        if group_by == 'month':
+            return day.replace(day=1)
+        if group_by == 'quarter':
+            return date(day.year, (day.month - 1) // 3 * 3 + 1, 1)
+        if group_by == 'year':
+            return date(day.year, 1, 1)
+        return day
+
+    @classmethod
+    def count_buckets(cls, start_date: str, end_date: str, group_by: str):
+        """ Сколько столбцов будет на графике при такой группировке """
+        start = date.fromisoformat(start_date)
+        end = date.fromisoformat(end_date)
+        if group_by == 'day':
+            return (end - start).days + 1
+        if group_by == 'week':
+            return (end - cls._bucket_start(start, 'week')).days // 7 + 1
+        months = (end.year - start.year) * 12 + end.month - start.month
+        if group_by == 'month':
+            return months + 1
+        if group_by == 'quarter':
+            return (end.year * 4 + (end.month - 1) // 3) - (start.year * 4 + (start.month - 1) // 3) + 1
+        return end.year - start.year + 1
+
+    @classmethod
+    def choose_bucket(cls, start_date: str, end_date: str, max_buckets: int = MAX_CHART_BUCKETS):
+        """ Самая мелкая группировка, при которой столбцов не больше max_buckets """
+        for group_by in PERIOD_BUCKETS:
+            if cls.count_buckets(start_date, end_date, group_by) <= max_buckets:
+                return group_by
+        return 'year'
+
+    @cached_query
     def get_income_expense_by_period(self, start_date: str, end_date: str, group_by: str = 'day'):
-        """ Получение данных для графика доходов/расходов"""
+        """ Получение данных для графика доходов/расходов
+
+        group_by - 'day', 'week', 'month', 'quarter', 'year' или 'auto' (выбирается по длине периода).
+        Периоды без операций возвращаются с нулями, подписи периодов:
+        'YYYY-MM-DD' (для недели - её понедельник), 'YYYY-MM', 'YYYY-Qn', 'YYYY'
+        """
+        if start_date > end_date:
+            return []  # пустой период - ни одного столбца (даты в ISO сравниваются как строки)
         try:
-            if group_by == 'day':
-                group_format = "strftime('%Y-%m-%d', operation_date)"
-            else:  # month
-                group_format = "strftime('%Y-%m', operation_date)"
+            if group_by == 'auto':
+                group_by = self.choose_bucket(start_date, end_date)
+            period_sql, step = PERIOD_BUCKETS[group_by]
 
+            if group_by in ('day', 'week'):
+                # недели пересекают границы месяцев, поэтому только дневные агрегаты
+                source = """SELECT day, category_id, operation_type, total_cents
+                            FROM Operations_daily WHERE day BETWEEN ? AND ?"""
+                params = [start_date, end_date]
+            else:
+                source, params = self._rollup_source(start_date, end_date)
+
+            first_bucket = self._bucket_start(date.fromisoformat(start_date), group_by).isoformat()
             with self.connection() as conn:
+                # Периоды генерируются рекурсивно, чтобы пустые попали в результат с нулями
                 cursor = conn.execute(f"""
+                    WITH RECURSIVE buckets(bucket_start) AS (
+                        SELECT ?
+                        UNION ALL
+                        SELECT date(bucket_start, '{step}') FROM buckets
+                        WHERE date(bucket_start, '{step}') <= ?
+                    ),
+                    totals AS (
+                        SELECT 
+                            {period_sql.format(column='day')} as period,
+                            SUM(CASE WHEN operation_type = 'income' THEN total_cents ELSE 0 END) as income_cents,
+                            SUM(CASE WHEN operation_type = 'expense' THEN total_cents ELSE 0 END) as expense_cents
+                        FROM ({source})
+                        GROUP BY period
+                    )
                     SELECT 
-                        {group_format} as period,
-                        SUM(CASE WHEN operation_type = 'income' THEN amount ELSE 0 END) as income,
-                        SUM(CASE WHEN operation_type = 'expense' THEN amount ELSE 0 END) as expense
-                    FROM Operations
-                    WHERE operation_date BETWEEN ? AND ?
-                    GROUP BY period
-                    ORDER BY period""", (start_date, end_date))
+                        {period_sql.format(column='bucket_start')} as period,
+                        COALESCE(totals.income_cents, 0) / 100.0 as income,
+                        COALESCE(totals.expense_cents, 0) / 100.0 as expense
+                    FROM buckets
+                    LEFT JOIN totals ON totals.period = {period_sql.format(column='bucket_start')}
+                    ORDER BY bucket_start""", [first_bucket, end_date, *params])
                 return [dict(row) for row in cursor.fetchall()]
         except Exception as e:
-            print(f"Ошибка при получении данных для графика: {e}")
+            self._log_error("Ошибка при получении данных для графика", e)
             return []
 
     # Методы для работы с бюджетом
+    @invalidates_cache
     def add_budget_limit(self, category_id: int, amount: float, month_year: str):
-        """ Добавление лимита бюджета для категории"""
+        """ Добавление лимита бюджета для категории (лимит на категорию и месяц один, см. find_budget_limit) """
         try:
             # Преобразуем дату начала и конца месяца
             start_date = month_year
@@ -168,8 +779,11 @@ class DatabaseManager:
                                       (category_id, amount, start_date, end_date))
                 conn.commit()
                 return True
+        except sqlite3.IntegrityError as e:
+            print(f"Ошибка при добавлении лимита: у категории уже есть лимит на {month_year} ({e})")
+            return False
         except Exception as e:
-            print(f"Ошибка при добавлении лимита: {e}")
+            self._log_error("Ошибка при добавлении лимита", e)
             return False
 
     def get_days_in_month(self, year: int, month: int):
@@ -178,6 +792,7 @@ class DatabaseManager:
             return 31
         return (date(year, month + 1, 1) - date(year, month, 1)).days
 
+    @cached_query
     def get_budget_limits(self, month_year: str):
         """ Получение всех бюджетных лимитов для месяца"""
         try:
@@ -186,28 +801,126 @@ class DatabaseManager:
             end_date = f"{year}-{month}-{self.get_days_in_month(int(year), int(month))}"
 
             with self.connection() as conn:
+                # Потрачено = расходы категории за месяц из месячных агрегатов (лимиты всегда на целый месяц)
                 cursor = conn.execute("""
                     SELECT 
                         Budget_limits.id,
                         Budget_limits.category_id,
                         Budget_limits.amount as limit_amount,
                         Categories.name as category_name,
-                        COALESCE((
-                            SELECT SUM(Operations.amount) 
-                            FROM Operations 
-                            WHERE Operations.category_id = Budget_limits.category_id 
-                            AND Operations.operation_date BETWEEN Budget_limits.start_date AND Budget_limits.end_date
-                        ), 0) as spent_amount
+                        COALESCE(Operations_monthly.total_cents, 0) / 100.0 as spent_amount
                     FROM Budget_limits
                     JOIN Categories ON Budget_limits.category_id = Categories.id
+                    LEFT JOIN Operations_monthly
+                        ON Operations_monthly.month = Budget_limits.start_date
+                        AND Operations_monthly.category_id = Budget_limits.category_id
+                        AND Operations_monthly.operation_type = 'expense'
                     WHERE Budget_limits.start_date = ? AND Budget_limits.end_date = ?
                     ORDER BY Categories.name
                 """, (start_date, end_date))
                 return [dict(row) for row in cursor.fetchall()]
         except Exception as e:
-            print(f"Ошибка при получении бюджетных лимитов: {e}")
+            self._log_error("Ошибка при получении бюджетных лимитов", e)
             return []
 
+    @cached_query
+    def get_budget_overview(self, start_month: str, end_month: str):
+        """ Лимиты и расходы по каждой категории за каждый месяц диапазона одним запросом
+
+        start_month, end_month - первые числа месяцев ('YYYY-MM-01'), включительно.
+        Возвращает [{'month', 'category_id', 'category_name', 'limit_amount', 'spent_amount'}],
+        отсортированные по категории и месяцу; месяцы без лимита в результат не попадают.
+        Лимит на категорию и месяц один (уникальный индекс), как и в get_budget_limits
+        """
+        try:
+            with self.connection() as conn:
+                cursor = conn.execute("""
+                    WITH limits AS (
+                        SELECT start_date as month, category_id, amount as limit_amount
+                        FROM Budget_limits
+                        WHERE start_date BETWEEN ? AND ?
+                        AND end_date = date(start_date, '+1 month', '-1 day')
+                    )
+                    SELECT 
+                        limits.month,
+                        limits.category_id,
+                        Categories.name as category_name,
+                        limits.limit_amount,
+                        COALESCE(Operations_monthly.total_cents, 0) / 100.0 as spent_amount
+                    FROM limits
+                    JOIN Categories ON limits.category_id = Categories.id
+                    LEFT JOIN Operations_monthly
+                        ON Operations_monthly.month = limits.month
+                        AND Operations_monthly.category_id = limits.category_id
+                        AND Operations_monthly.operation_type = 'expense'
+                    ORDER BY Categories.name, limits.month
+                """, (start_month, end_month))
+                return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            self._log_error("Ошибка при получении обзора бюджета", e)
+            return []
+
+    @cached_query
+    def get_budget_limit_by_id(self, limit_id: int):
+        """ Получение одного бюджетного лимита по ID (None, если не найден) """
+        try:
+            with self.connection() as conn:
+                row = conn.execute("""
+                    SELECT 
+                        Budget_limits.id,
+                        Budget_limits.category_id,
+                        Budget_limits.amount as limit_amount,
+                        Budget_limits.start_date,
+                        Budget_limits.end_date,
+                        Categories.name as category_name
+                    FROM Budget_limits
+                    JOIN Categories ON Budget_limits.category_id = Categories.id
+                    WHERE Budget_limits.id = ?""", (limit_id,)).fetchone()
+                return dict(row) if row else None
+        except Exception as e:
+            self._log_error("Ошибка при загрузке лимита", e)
+            return None
+
+    @cached_query
+    def find_budget_limit(self, category_id: int, month_year: str):
+        """ Лимит категории на месяц (None, если его нет) - перед добавлением или переносом лимита """
+        try:
+            year, month, _ = month_year.split('-')
+            end_date = f"{year}-{month}-{self.get_days_in_month(int(year), int(month))}"
+            with self.connection() as conn:
+                row = conn.execute("""
+                    SELECT id, category_id, amount as limit_amount, start_date, end_date
+                    FROM Budget_limits
+                    WHERE start_date = ? AND category_id = ? AND end_date = ?""",
+                                   (month_year, category_id, end_date)).fetchone()
+                return dict(row) if row else None
+        except Exception as e:
+            self._log_error("Ошибка при поиске лимита", e)
+            return None
+
+    @invalidates_cache
+    def update_budget_limit(self, limit_id: int, category_id: int, amount: float, month_year: str):
+        """ Изменение бюджетного лимита на месте (ID сохраняется) """
+        try:
+            start_date = month_year
+            year, month, _ = month_year.split('-')
+            end_date = f"{year}-{month}-{self.get_days_in_month(int(year), int(month))}"
+
+            with self.connection() as conn:
+                cursor = conn.execute("""
+                    UPDATE Budget_limits
+                    SET category_id = ?, amount = ?, period_type = 'month', start_date = ?, end_date = ?
+                    WHERE id = ?""", (category_id, amount, start_date, end_date, limit_id))
+                conn.commit()
+                return cursor.rowcount == 1
+        except sqlite3.IntegrityError as e:
+            print(f"Ошибка при изменении лимита: у категории уже есть лимит на {month_year} ({e})")
+            return False
+        except Exception as e:
+            self._log_error("Ошибка при изменении лимита", e)
+            return False
+
+    @invalidates_cache
     def delete_budget_limit(self, limit_id: int):
         """ Удаление бюджетного лимита"""
         try:
@@ -216,7 +929,7 @@ class DatabaseManager:
                 conn.commit()
                 return True
         except Exception as e:
-            print(f"Ошибка при удалении лимита: {e}")
+            self._log_error("Ошибка при удалении лимита", e)
             return False
 
 
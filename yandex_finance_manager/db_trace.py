@@ -0,0 +1,261 @@
+import inspect
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from functools import wraps
+
+# Включение через переменные окружения: FINANCE_MANAGER_TRACE=1 - собирать статистику,
+# FINANCE_MANAGER_SLOW_MS - порог медленного вызова, FINANCE_MANAGER_TRACE_FILE - куда сохранить отчет в JSON
+TRACE_ENV = 'FINANCE_MANAGER_TRACE'
+SLOW_MS_ENV = 'FINANCE_MANAGER_SLOW_MS'
+TRACE_FILE_ENV = 'FINANCE_MANAGER_TRACE_FILE'
+
+SLOW_MS = 100.0  # порог по умолчанию
+SLOW_LOG_SIZE = 200  # сколько последних медленных вызовов храним
+LARGE_TABLE_ROWS = 1000  # полный просмотр или сортировка без индекса заметны только на таблицах от этого размера
+HISTOGRAM_BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000)  # верхние границы корзин, последняя - "больше"
+# служебные методы DatabaseManager, которые не замеряем
+SKIPPED_METHODS = {'connection', 'close', 'close_thread_connection', 'set_cancel_event', 'is_cancelled',
+                   'clear_cache', 'cache_stats'}
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_sql(sql: str):
+    """ Текст запроса без конкретных значений: по нему запросы группируются и EXPLAIN выполняется один раз """
+    sql = _STRING_LITERAL.sub("?", sql)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    sql = _PLACEHOLDER_LIST.sub("?, ...", sql)  # IN (?, ?, ?) с разным числом значений - один запрос
+    return _WHITESPACE.sub(" ", sql).strip()
+
+
+class MethodHistogram:
+    """ Распределение длительности вызовов одного метода """
+    def __init__(self):
+        self.buckets = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, ms: float):
+        index = 0
+        while index < len(HISTOGRAM_BUCKETS_MS) and ms > HISTOGRAM_BUCKETS_MS[index]:
+            index += 1
+        self.buckets[index] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def to_dict(self):
+        labels = [f"<={bound}" for bound in HISTOGRAM_BUCKETS_MS] + [f">{HISTOGRAM_BUCKETS_MS[-1]}"]
+        return {
+            'count': self.count,
+            'total_ms': round(self.total_ms, 3),
+            'avg_ms': round(self.total_ms / self.count, 3) if self.count else 0,
+            'max_ms': round(self.max_ms, 3),
+            'histogram_ms': dict(zip(labels, self.buckets)),
+        }
+
+
+class DatabaseTracer:
+    """ Инструментирование DatabaseManager: время методов, журнал медленных вызовов, SQL и планы запросов
+
+    Выключенный трассировщик не создается вовсе (см. from_environment), поэтому без переменной
+    окружения методы DatabaseManager не оборачиваются и соединения работают без trace callback.
+    """
+    def __init__(self, slow_ms: float = SLOW_MS, trace_file: str = None):
+        self.slow_ms = slow_ms
+        self.trace_file = trace_file
+        self.histograms = {}  # метод -> MethodHistogram
+        self.slow_log = deque(maxlen=SLOW_LOG_SIZE)
+        self.statements = {}  # нормализованный SQL -> число выполнений
+        self.plans = {}  # нормализованный SQL -> строки EXPLAIN QUERY PLAN
+        self.warnings = {}  # нормализованный SQL -> причины (полный просмотр таблицы, временное B-дерево)
+        self._table_rows = {}  # таблица -> примерное число строк (CTE и подзапросы в планах сюда не попадают)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @classmethod
+    def from_environment(cls):
+        """ Трассировщик, если он включен переменной окружения, иначе None """
+        if os.environ.get(TRACE_ENV, '') in ('', '0'):
+            return None
+        try:
+            slow_ms = float(os.environ.get(SLOW_MS_ENV, SLOW_MS))
+        except ValueError:
+            print(f"Некорректное значение {SLOW_MS_ENV}, используется {SLOW_MS} мс")
+            slow_ms = SLOW_MS
+        return cls(slow_ms, os.environ.get(TRACE_FILE_ENV) or None)
+
+    def attach(self, manager):
+        """ Оборачиваем публичные методы экземпляра DatabaseManager (класс не меняется) """
+        self.manager = manager
+        for name, attribute in vars(type(manager)).items():
+            if name.startswith('_') or name in SKIPPED_METHODS:
+                continue
+            # статические методы, константы и генераторы (время генератора - это время его обхода) пропускаем
+            if not inspect.isfunction(attribute) or inspect.isgeneratorfunction(inspect.unwrap(attribute)):
+                continue
+            setattr(manager, name, self._wrap(name, getattr(manager, name)))
+
+    def trace(self, sql: str):
+        """ trace callback соединения: SQLite передает текст каждого выполняемого запроса """
+        if getattr(self._local, 'explaining', False) or sql.startswith('--'):
+            return  # собственные EXPLAIN и строки триггеров ("-- TRIGGER ...") не учитываем
+        normalized = normalize_sql(sql)
+        with self._lock:
+            self.statements[normalized] = self.statements.get(normalized, 0) + 1
+            explained = normalized in self.plans
+        captured = getattr(self._local, 'captured', None)
+        if captured is not None and normalized not in captured:
+            captured[normalized] = None if explained else sql
+
+    def _wrap(self, name, method):
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            outer = getattr(self._local, 'captured', None) is None
+            if outer:
+                self._local.captured = {}  # SQL, выполненный во время вызова (вложенные вызовы - туда же)
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                ms = (time.perf_counter() - start) * 1000
+                self._record(name, ms)
+                if outer:
+                    captured, self._local.captured = self._local.captured, None
+                    if ms >= self.slow_ms:
+                        self._log_slow(name, ms, args, kwargs, captured)
+                    self._explain_new(captured)
+        return wrapper
+
+    def _record(self, name, ms):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = MethodHistogram()
+            histogram.add(ms)
+
+    def _log_slow(self, name, ms, args, kwargs, captured):
+        arguments = ", ".join([repr(arg)[:80] for arg in args] +
+                              [f"{key}={value!r}"[:80] for key, value in kwargs.items()])
+        entry = {
+            'time': time.strftime('%H:%M:%S'),
+            'method': name,
+            'ms': round(ms, 3),
+            'args': arguments,
+            'sql': list(captured),
+        }
+        with self._lock:
+            self.slow_log.append(entry)
+        print(f"Медленный вызов {name}({arguments}): {ms:.1f} мс")
+        for sql in captured:
+            print(f"    {sql[:300]}")
+
+    def _explain_new(self, captured):
+        """ EXPLAIN QUERY PLAN для запросов, которые встретились впервые """
+        for normalized, sql in captured.items():
+            if sql is None or not sql.lstrip().upper().startswith(('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')):
+                continue
+            with self._lock:
+                if normalized in self.plans:
+                    continue
+                self.plans[normalized] = []  # другие потоки этот запрос уже не разбирают
+            self._local.explaining = True
+            try:
+                conn = self.manager.connection()
+                plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()]
+                warnings = self._plan_warnings(conn, plan)
+            except Exception as e:
+                plan, warnings = [f"не удалось получить план: {e}"], []
+            finally:
+                self._local.explaining = False
+            with self._lock:
+                self.plans[normalized] = plan
+                if warnings:
+                    self.warnings[normalized] = warnings
+            if warnings:
+                print(f"План запроса: {'; '.join(warnings)}\n    {normalized[:300]}")
+
+    def _plan_warnings(self, conn, plan):
+        """ Полные просмотры больших таблиц и сортировки во временном B-дереве по ним """
+        warnings = []
+        large = False
+        for detail in plan:
+            match = re.match(r"(SCAN|SEARCH) (\w+)", detail)
+            if match is None or self._estimate_rows(conn, match.group(2)) < LARGE_TABLE_ROWS:
+                continue
+            large = True
+            if match.group(1) == 'SCAN' and detail == match.group(0):  # SCAN без USING INDEX
+                warnings.append(f"полный просмотр таблицы {match.group(2)}")
+        if large:
+            warnings.extend(detail.lower() for detail in plan if detail.startswith("USE TEMP B-TREE"))
+        return warnings
+
+    def _estimate_rows(self, conn, table):
+        """ Примерное число строк: из статистики ANALYZE или по MAX(rowid); 0 - не таблица """
+        key = table.lower()
+        if key not in self._table_rows:
+            rows = 0
+            exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ? COLLATE NOCASE",
+                                  (table,)).fetchone()
+            if exists:
+                try:
+                    stat = conn.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = ? COLLATE NOCASE LIMIT 1",
+                                        (table,)).fetchone()
+                except Exception:
+                    stat = None  # ANALYZE еще не выполнялся
+                if stat:
+                    rows = int(stat[0].split()[0])
+                else:
+                    try:
+                        rows = conn.execute(f'SELECT MAX(rowid) FROM "{table}"').fetchone()[0] or 0
+                    except Exception:
+                        rows = LARGE_TABLE_ROWS  # WITHOUT ROWID - размер неизвестен, считаем большой
+            self._table_rows[key] = rows
+        return self._table_rows[key]
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'slow_ms': self.slow_ms,
+                'methods': {name: histogram.to_dict() for name, histogram in sorted(self.histograms.items())},
+                'slow_log': list(self.slow_log),
+                'statements': [{'sql': sql, 'count': count, 'plan': self.plans.get(sql, []),
+                                'warnings': self.warnings.get(sql, [])}
+                               for sql, count in sorted(self.statements.items(), key=lambda item: -item[1])],
+            }
+
+    def report(self):
+        """ Текстовая сводка для вывода в консоль """
+        data = self.to_dict()
+        lines = ["Вызовы DatabaseManager:"]
+        width = max((len(name) for name in data['methods']), default=0)
+        for name, stats in sorted(data['methods'].items(), key=lambda item: -item[1]['total_ms']):
+            lines.append(f"  {name:<{width}}  {stats['count']:6} выз.  среднее {stats['avg_ms']:8.2f} мс  "
+                         f"макс. {stats['max_ms']:8.2f} мс")
+        lines.append(f"Медленных вызовов (>= {self.slow_ms:g} мс): {len(data['slow_log'])}")
+        flagged = [statement for statement in data['statements'] if statement['warnings']]
+        if flagged:
+            lines.append("Запросы с подозрительным планом:")
+            for statement in flagged:
+                lines.append(f"  {statement['count']:6} раз: {'; '.join(statement['warnings'])}")
+                lines.append(f"      {statement['sql'][:300]}")
+        return "\n".join(lines)
+
+    def save(self, path: str = None):
+        """ Отчет в JSON (по умолчанию в файл из FINANCE_MANAGER_TRACE_FILE) """
+        path = path or self.trace_file
+        if not path:
+            return
+        try:
+            with open(path, 'w', encoding='utf-8') as file:
+                json.dump(self.to_dict(), file, ensure_ascii=False, indent=2)
+        except OSError as e:
+            print(f"Ошибка при сохранении отчета трассировки: {e}")
@@ -0,0 +1,74 @@
+class DataChange:
+    """ Описание изменения данных, которое рассылает главное окно
+
+    entity - что изменилось: 'operation', 'budget_limit', 'category' или 'all' (неизвестно что, например импорт)
+    action - 'insert', 'update', 'delete' или 'reload'
+    dates - затронутые даты (для изменения операции - старая и новая дата), пусто = любые
+    category_ids - затронутые категории, пусто = любые
+    """
+    def __init__(self, entity: str, action: str = 'reload', ids=(), dates=(), category_ids=()):
+        self.entity = entity
+        self.action = action
+        self.ids = tuple(ids)
+        self.dates = tuple(day for day in dates if day)
+        self.category_ids = frozenset(category_id for category_id in category_ids if category_id is not None)
+
+    @classmethod
+    def everything(cls):
+        """ Изменилось что угодно - всем нужно перечитать данные """
+        return cls('all')
+
+    @property
+    def start_date(self):
+        return min(self.dates) if self.dates else None
+
+    @property
+    def end_date(self):
+        return max(self.dates) if self.dates else None
+
+    def touches(self, *entities):
+        return self.entity == 'all' or self.entity in entities
+
+    def affects_dates(self, start_date: str, end_date: str):
+        """ Пересекается ли изменение с периодом (даты в формате ISO) """
+        if not self.dates:
+            return True
+        return any(start_date <= day <= end_date for day in self.dates)
+
+    def affects_categories(self, category_ids):
+        if not self.category_ids:
+            return True
+        return not self.category_ids.isdisjoint(category_ids)
+
+    def __repr__(self):
+        return (f"DataChange({self.entity!r}, {self.action!r}, ids={self.ids}, dates={self.dates}, "
+                f"category_ids={sorted(self.category_ids)})")
+
+
+class DeferredRefreshMixin:
+    """ Вкладка, которая обновляется по DataChange только если она видна
+
+    Скрытая вкладка лишь помечает данные устаревшими и перечитывает их при показе.
+    Вкладка определяет is_affected_by(change) и при необходимости apply_change(change).
+    """
+    data_dirty = False
+
+    def is_affected_by(self, change):
+        return True
+
+    def apply_change(self, change):
+        self.refresh_data()
+
+    def on_data_changed(self, change):
+        if not self.is_affected_by(change):
+            return
+        if self.isVisible():
+            self.apply_change(change)
+        else:
+            self.data_dirty = True
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self.data_dirty:
+            self.data_dirty = False
+            self.refresh_data()
@@ -0,0 +1,168 @@
+from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel, QComboBox,
+                             QDateEdit, QCheckBox, QPushButton, QFileDialog,
+                             QProgressDialog, QMessageBox)
+from PyQt6.QtCore import Qt, QDate, QThread, pyqtSignal
+import db_methods
+import operations_export
+from query_runner import query_runner
+
+
+class ExportWorker(QThread):
+    """ Выгрузка операций в отдельном потоке """
+    progress_changed = pyqtSignal(int)
+    export_finished = pyqtSignal(int, bool)  # (выгружено операций, прервано ли)
+    export_failed = pyqtSignal(str)
+
+    def __init__(self, path, export_format, compress, filters, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.export_format = export_format
+        self.compress = compress
+        self.filters = filters
+
+    def run(self):
+        try:
+            exported = operations_export.export_operations(
+                self.path, self.export_format, self.filters, self.compress,
+                progress=self.progress_changed.emit,
+                should_stop=self.isInterruptionRequested)
+            self.export_finished.emit(exported, self.isInterruptionRequested())
+        except Exception as e:
+            self.export_failed.emit(str(e))
+        finally:
+            db_methods.db_manager.close_thread_connection()  # соединение этого потока больше не понадобится
+
+
+class ExportDialog(QDialog):
+    """ Диалоговое окно с параметрами выгрузки операций """
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Экспорт операций")
+        self.setModal(True)
+        self.initUI()
+
+    def initUI(self):
+        layout = QVBoxLayout(self)
+
+        # Период
+        self.all_dates_check = QCheckBox("За всё время")
+        self.all_dates_check.setChecked(True)
+        self.all_dates_check.toggled.connect(self.on_all_dates_toggled)
+        layout.addWidget(self.all_dates_check)
+
+        dates_layout = QHBoxLayout()
+        self.start_date_edit = QDateEdit()
+        self.start_date_edit.setCalendarPopup(True)
+        self.start_date_edit.setDate(QDate.currentDate().addMonths(-1))
+        self.end_date_edit = QDateEdit()
+        self.end_date_edit.setCalendarPopup(True)
+        self.end_date_edit.setDate(QDate.currentDate())
+        dates_layout.addWidget(QLabel("с:"))
+        dates_layout.addWidget(self.start_date_edit)
+        dates_layout.addWidget(QLabel("по:"))
+        dates_layout.addWidget(self.end_date_edit)
+        layout.addLayout(dates_layout)
+        self.on_all_dates_toggled(True)
+
+        # Тип операций
+        type_layout = QHBoxLayout()
+        type_layout.addWidget(QLabel("Операции:"))
+        self.type_combo = QComboBox()
+        self.type_combo.addItem("Все операции", "all")
+        self.type_combo.addItem("Только доходы", "income")
+        self.type_combo.addItem("Только расходы", "expense")
+        type_layout.addWidget(self.type_combo)
+        layout.addLayout(type_layout)
+
+        # Формат файла
+        format_layout = QHBoxLayout()
+        format_layout.addWidget(QLabel("Формат:"))
+        self.format_combo = QComboBox()
+        self.format_combo.addItem("CSV", "csv")
+        self.format_combo.addItem("JSON Lines", "jsonl")
+        format_layout.addWidget(self.format_combo)
+        self.gzip_check = QCheckBox("Сжать (gzip)")
+        format_layout.addWidget(self.gzip_check)
+        layout.addLayout(format_layout)
+
+        # Кнопки
+        buttons_layout = QHBoxLayout()
+
+        cancel_btn = QPushButton("Отменить")
+        cancel_btn.clicked.connect(self.reject)
+        buttons_layout.addWidget(cancel_btn)
+
+        export_btn = QPushButton("Экспорт")
+        export_btn.clicked.connect(self.accept)
+        buttons_layout.addWidget(export_btn)
+
+        layout.addLayout(buttons_layout)
+
+    def on_all_dates_toggled(self, checked):
+        self.start_date_edit.setEnabled(not checked)
+        self.end_date_edit.setEnabled(not checked)
+
+    def filters(self):
+        """ Фильтры для DatabaseManager.iter_operations """
+        filters = {'type': self.type_combo.currentData()}
+        if not self.all_dates_check.isChecked():
+            filters['date_from'] = self.start_date_edit.date().toString(Qt.DateFormat.ISODate)
+            filters['date_to'] = self.end_date_edit.date().toString(Qt.DateFormat.ISODate)
+        return filters
+
+    def file_suffix(self):
+        suffix = '.' + self.format_combo.currentData()
+        if self.gzip_check.isChecked():
+            suffix += '.gz'
+        return suffix
+
+
+def show_export_dialog(window):
+    """ Выбор параметров и файла, затем выгрузка с окном прогресса """
+    dialog = ExportDialog(window)
+    if dialog.exec() != QDialog.DialogCode.Accepted:
+        return
+
+    suffix = dialog.file_suffix()
+    path, _ = QFileDialog.getSaveFileName(window, "Экспорт операций", "operations" + suffix,
+                                          f"Файлы (*{suffix})")
+    if not path:
+        return
+    if not path.lower().endswith(suffix):
+        path += suffix
+
+    filters = dialog.filters()
+
+    # пока операции считаются в фоне, окно прогресса показывает "занято" (максимум 0)
+    progress_dialog = QProgressDialog("Экспорт операций...", "Отменить", 0, 0, window)
+    progress_dialog.setWindowTitle("Экспорт операций")
+    progress_dialog.setWindowModality(Qt.WindowModality.WindowModal)
+    progress_dialog.setMinimumDuration(0)
+    progress_dialog.setAutoClose(False)
+    progress_dialog.setAutoReset(False)
+
+    worker = ExportWorker(path, dialog.format_combo.currentData(), dialog.gzip_check.isChecked(),
+                          filters, window)
+
+    def on_finished(exported, cancelled):
+        query_runner.cancel('export_count')  # выгрузка закончилась раньше подсчета
+        progress_dialog.close()
+        message = f"Выгружено операций: {exported}"
+        if cancelled:
+            message += "\nЭкспорт прерван, файл содержит только часть операций"
+        QMessageBox.information(window, 'Экспорт операций', message)
+
+    def on_failed(error):
+        query_runner.cancel('export_count')
+        progress_dialog.close()
+        QMessageBox.critical(window, 'Ошибка', f'Не удалось выгрузить операции: {error}')
+
+    worker.progress_changed.connect(progress_dialog.setValue)
+    worker.export_finished.connect(on_finished)
+    worker.export_failed.connect(on_failed)
+    worker.finished.connect(worker.deleteLater)
+    progress_dialog.canceled.connect(worker.requestInterruption)
+    progress_dialog.canceled.connect(lambda: query_runner.cancel('export_count'))
+    query_runner.submit('export_count', db_methods.db_manager.count_operations, filters,
+                        callback=lambda total: progress_dialog.setMaximum(max(total, 1)))
+    worker.start()
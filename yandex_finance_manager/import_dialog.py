@@ -0,0 +1,69 @@
+from PyQt6.QtWidgets import QFileDialog, QProgressDialog, QMessageBox
+from PyQt6.QtCore import Qt, QThread, pyqtSignal
+import db_methods
+import operations_import
+
+
+class ImportWorker(QThread):
+    """ Импорт выписки в отдельном потоке, чтобы интерфейс не зависал """
+    progress_changed = pyqtSignal(int, int)  # (промилле файла, импортировано строк)
+    import_finished = pyqtSignal(dict)
+    import_failed = pyqtSignal(str)
+
+    def __init__(self, path, parent=None):
+        super().__init__(parent)
+        self.path = path
+
+    def run(self):
+        try:
+            result = operations_import.import_statement(
+                self.path,
+                progress=lambda share, imported: self.progress_changed.emit(int(share * 1000), imported),
+                should_stop=self.isInterruptionRequested)
+            self.import_finished.emit(result)
+        except Exception as e:
+            self.import_failed.emit(str(e))
+        finally:
+            db_methods.db_manager.close_thread_connection()  # соединение этого потока больше не понадобится
+
+
+def show_import_dialog(window):
+    """ Выбор CSV-файла и импорт с окном прогресса """
+    path, _ = QFileDialog.getOpenFileName(window, "Импорт выписки", "", "CSV файлы (*.csv);;Все файлы (*)")
+    if not path:
+        return
+
+    progress_dialog = QProgressDialog("Импорт операций...", "Отменить", 0, 1000, window)
+    progress_dialog.setWindowTitle("Импорт выписки")
+    progress_dialog.setWindowModality(Qt.WindowModality.WindowModal)
+    progress_dialog.setMinimumDuration(0)
+    progress_dialog.setAutoClose(False)
+    progress_dialog.setAutoReset(False)
+
+    worker = ImportWorker(path, window)
+
+    def on_progress(value, imported):
+        progress_dialog.setValue(value)
+        progress_dialog.setLabelText(f"Импортировано операций: {imported}")
+
+    def on_finished(result):
+        progress_dialog.close()
+        message = f"Импортировано операций: {result['imported']}\nПропущено строк: {result['skipped']}"
+        if result['created_categories']:
+            message += f"\nСозданы категории: {', '.join(result['created_categories'])}"
+        if result['cancelled']:
+            message += "\n\nИмпорт прерван, уже загруженные операции сохранены"
+        QMessageBox.information(window, 'Импорт выписки', message)
+        window.notify_data_updated()
+
+    def on_failed(error):
+        progress_dialog.close()
+        QMessageBox.critical(window, 'Ошибка', f'Не удалось импортировать выписку: {error}')
+        window.notify_data_updated()  # часть пачек могла успеть сохраниться
+
+    worker.progress_changed.connect(on_progress)
+    worker.import_finished.connect(on_finished)
+    worker.import_failed.connect(on_failed)
+    worker.finished.connect(worker.deleteLater)
+    progress_dialog.canceled.connect(worker.requestInterruption)
+    worker.start()
@@ -0,0 +1,259 @@
+import itertools
+import math
+import os
+import random
+import sqlite3
+import time
+from datetime import date, timedelta
+import database
+
+SEED = 42
+YEARS = 3  # за сколько лет генерируются операции
+END = date(2025, 12, 31)  # дата последней операции по умолчанию: фиксированная, чтобы зерно однозначно задавало БД
+FTS_BUILD_HASHSIZE = 64 * 1024 * 1024  # буфер FTS5 при построении индекса: меньше сегментов и слияний
+FTS_HASHSIZE = 1024 * 1024  # значение FTS5 по умолчанию, возвращается после построения
+POOL_SIZE = 4096  # заготовленных сумм и описаний на категорию - выбор из пула быстрее генерации каждой строки
+
+# Расходы: доля операций категории (распределение скошено к повседневным тратам),
+# медиана суммы и разброс логнормального распределения
+EXPENSE_PROFILE = {
+    'Еда': (55, 450, 0.8),
+    'Транспорт': (20, 180, 0.7),
+    'Развлечения': (9, 1200, 0.9),
+    'Здоровье': (6, 900, 1.0),
+    'Одежда': (5, 3000, 0.8),
+    'Образование': (3, 4000, 0.9),
+    'Коммунальные услуги': (2, 1500, 0.5),
+}
+# Вес дней: по выходным и в декабре тратят больше
+WEEKEND_WEIGHT = 1.4
+MONTH_WEIGHTS = {12: 1.3, 1: 0.85, 7: 1.1, 8: 1.1}
+
+SALARY = 120_000  # зарплата за месяц в первый год, выплачивается авансом 20-го и остатком 5-го
+INCOME_RATIO = 0.8  # на больших журналах зарплата растет вместе с тратами; с премиями и индексацией доходы ~на 10% больше
+SALARY_GROWTH = 0.08  # ежегодная индексация
+BONUS_MONTHS = {3: 0.5, 6: 0.5, 9: 0.5, 12: 1.5}  # квартальные премии (доля зарплаты), годовая - в декабре
+DIVIDEND_MONTHS = (4, 7, 10)
+UTILITY_DAY = 10  # квитанция за квартиру, зимой дороже из-за отопления
+UTILITY_BASE = 6000
+UTILITY_WINTER = 1.6
+
+BUDGET_SLACK = (0.85, 1.3)  # лимит месяца = фактические расходы × случайный множитель (часть лимитов превышена)
+
+MERCHANTS = {
+    'Еда': ("Пятёрочка", "Перекрёсток", "ВкусВилл", "Магнит", "Лента", "Азбука вкуса", "Самокат",
+            "Яндекс Лавка", "пекарня у дома", "рынок", "кофейня", "столовая", "Шоколадница", "Теремок"),
+    'Транспорт': ("Метро", "Яндекс Такси", "Ситимобил", "Аэроэкспресс", "АЗС Лукойл", "АЗС Газпромнефть",
+                  "каршеринг", "парковка", "электричка", "Тройка"),
+    'Развлечения': ("Кинопоиск", "Синема Парк", "Яндекс Музыка", "боулинг", "театр", "концерт",
+                    "бар", "музей", "квест", "Steam"),
+    'Здоровье': ("Аптека Ригла", "Аптека 36,6", "Инвитро", "стоматология", "клиника", "фитнес-клуб",
+                 "бассейн", "массаж"),
+    'Одежда': ("Zara", "Uniqlo", "Спортмастер", "Wildberries", "Ozon", "Lamoda", "обувной", "химчистка"),
+    'Образование': ("Яндекс Практикум", "Stepik", "книжный", "Литрес", "курсы английского", "репетитор",
+                    "учебники", "вебинар"),
+    'Коммунальные услуги': ("МосЭнергоСбыт", "Мосводоканал", "интернет", "мобильная связь", "ЖКУ",
+                            "Мосгаз", "вывоз мусора"),
+}
+NOTES = ("продукты на неделю", "обед с коллегами", "по дороге домой", "подарок на день рождения",
+         "оплата по QR-коду", "возврат частично", "по акции", "кешбэк 5%", "для дачи", "поездка к родителям",
+         "скидка по карте лояльности", "заказ с доставкой", "вместе с семьёй", "разовая покупка",
+         "ежемесячная подписка", "записал позже по чеку", "в командировке", "на выходных")
+
+
+def ledger_start(end: date, years: int = YEARS):
+    """ Дата первой операции журнала, который заканчивается днем end """
+    return end - timedelta(days=round(365.25 * years)) + timedelta(days=1)
+
+
+def build_pools(rng: random.Random, categories: dict):
+    """ Пулы сумм и описаний для категорий расходов (логнормальные суммы, описания разной длины) """
+    amounts = {}
+    descriptions = {}
+    for name, (_, median, sigma) in EXPENSE_PROFILE.items():
+        category_id = categories[name]
+        amounts[category_id] = [max(1.0, round(median * math.exp(rng.gauss(0, sigma)), 2))
+                                for _ in range(POOL_SIZE)]
+        pool = []
+        for _ in range(POOL_SIZE):
+            parts = [rng.choice(MERCHANTS[name])]
+            # примерно треть описаний длинные - с несколькими пометками и номером чека
+            for _ in range(rng.choice((0, 0, 1, 1, 2, 4))):
+                parts.append(rng.choice(NOTES))
+            if rng.random() < 0.2:
+                parts.append(f"чек №{rng.randrange(10 ** 5, 10 ** 9)}")
+            pool.append(", ".join(parts))
+        descriptions[category_id] = pool
+    return amounts, descriptions
+
+
+def regular_operations(rng: random.Random, categories: dict, start: date, end: date, salary_base: float = SALARY):
+    """ Регулярные операции по дням: зарплата, премии, дивиденды и квитанция за квартиру """
+    by_day = {}
+
+    def add(day, category, description, amount, operation_type):
+        if start <= day <= end:
+            by_day.setdefault(day, []).append(
+                (day.isoformat(), categories[category], description, round(amount, 2), operation_type))
+
+    month = start.replace(day=1)
+    while month <= end:
+        salary = salary_base * (1 + SALARY_GROWTH) ** (month.year - start.year)
+        add(month.replace(day=5), 'Зарплата', "Зарплата за прошлый месяц", salary * 0.6, 'income')
+        add(month.replace(day=20), 'Зарплата', "Аванс", salary * 0.4, 'income')
+        if month.month in BONUS_MONTHS:
+            add(month.replace(day=25), 'Премия', "Премия по итогам квартала" if month.month != 12
+                else "Годовая премия", salary * BONUS_MONTHS[month.month], 'income')
+        if month.month in DIVIDEND_MONTHS:
+            add(month.replace(day=15), 'Инвестиции', "Дивиденды по акциям",
+                salary * rng.uniform(0.02, 0.08), 'income')
+        utility = UTILITY_BASE * (UTILITY_WINTER if month.month in (11, 12, 1, 2, 3) else 1)
+        add(month.replace(day=UTILITY_DAY), 'Коммунальные услуги', "Квитанция ЖКУ за прошлый месяц",
+            utility * rng.uniform(0.9, 1.1), 'expense')
+        month = (month + timedelta(days=32)).replace(day=1)
+    return by_day
+
+
+def daily_counts(start: date, days: int, total: int):
+    """ Число ежедневных трат по дням: ровно total, пропорционально весу дня """
+    weights = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        weight = MONTH_WEIGHTS.get(day.month, 1.0)
+        if day.weekday() >= 5:
+            weight *= WEEKEND_WEIGHT
+        weights.append(weight)
+    scale = total / sum(weights)
+    counts = [int(weight * scale) for weight in weights]
+    for offset in range(total - sum(counts)):  # остаток от округления раздаем по дням
+        counts[offset % days] += 1
+    return counts
+
+
+def generate_operations(operations: int, categories: dict, seed: int = SEED, years: int = YEARS,
+                        end: date = END):
+    """ Операции (operation_date, category_id, description, amount, operation_type) в порядке дат """
+    rng = random.Random(seed)
+    start = ledger_start(end, years)
+    days = (end - start).days + 1
+
+    amounts, descriptions = build_pools(rng, categories)
+    expense_ids = [categories[name] for name in EXPENSE_PROFILE]
+    weights = [weight for weight, _, _ in EXPENSE_PROFILE.values()]
+    cum_weights = list(itertools.accumulate(weights))
+
+    # средние траты за месяц, чтобы зарплата была им под стать (премии идут сверху)
+    average_amount = sum(weight * sum(amounts[category_id]) / POOL_SIZE
+                         for weight, category_id in zip(weights, expense_ids)) / cum_weights[-1]
+    monthly_expense = operations / days * 365.25 / 12 * average_amount
+    regular = regular_operations(rng, categories, start, end, max(SALARY, monthly_expense * INCOME_RATIO))
+    regular_total = sum(len(day_operations) for day_operations in regular.values())
+    if regular_total > operations:
+        regular = {}  # слишком маленький журнал - только ежедневные траты
+        regular_total = 0
+    counts = daily_counts(start, days, operations - regular_total)
+    random_value = rng.random
+
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        yield from regular.get(day, ())
+        iso_day = day.isoformat()
+        for category_id in rng.choices(expense_ids, cum_weights=cum_weights, k=counts[offset]):
+            yield (iso_day, category_id, descriptions[category_id][int(random_value() * POOL_SIZE)],
+                   amounts[category_id][int(random_value() * POOL_SIZE)], 'expense')
+
+
+def database_files(db_path: str):
+    """ Файл БД и служебные файлы SQLite рядом с ним """
+    return db_path, db_path + "-journal", db_path + "-wal", db_path + "-shm"
+
+
+def generate(db_path: str = database.DB_PATH, operations: int = 100_000, seed: int = SEED,
+             years: int = YEARS, end: date = END):
+    """ Новая БД с operations операциями и лимитами на каждый месяц
+
+    Схема и категории создаются через database.init_database. Индексы и триггеры Operations
+    на время вставки удаляются, а агрегаты, точки баланса и поисковый индекс строятся
+    одним проходом после неё - так 10 млн строк вставляются в разы быстрее, чем через триггеры
+    """
+    if os.path.exists(db_path):
+        raise FileExistsError(f"Файл {db_path} уже существует")
+    database.init_database(db_path)
+
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        # файл создается с нуля: при сбое его проще сгенерировать заново, журнал не нужен
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("PRAGMA cache_size = -262144")  # 256 МБ на построение индексов
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute(f"PRAGMA threads = {os.cpu_count() or 1}")  # сортировка для CREATE INDEX в несколько потоков
+        conn.execute("PRAGMA analysis_limit = 1000")  # статистике планировщика хватает выборки
+        cursor = conn.cursor()
+        cursor.execute("BEGIN")
+        categories = dict(cursor.execute("SELECT name, id FROM Categories").fetchall())
+
+        schema = cursor.execute("""SELECT type, name, sql FROM sqlite_master
+                                   WHERE tbl_name = 'Operations' AND type IN ('index', 'trigger')
+                                   AND sql IS NOT NULL""").fetchall()
+        for object_type, name, _ in schema:
+            cursor.execute(f"DROP {object_type.upper()} {name}")
+
+        # строки создаются по мере вставки, весь журнал в памяти не держим
+        cursor.executemany("""
+            INSERT INTO Operations (operation_date, category_id, description, amount, operation_type)
+            VALUES (?, ?, ?, ?, ?)""", generate_operations(operations, categories, seed, years, end))
+
+        # сначала индексы, потом триггеры - в том же виде, в каком их создали миграции
+        for object_type, _, sql in sorted(schema, key=lambda item: item[0] != 'index'):
+            cursor.execute(sql)
+        database.rebuild_rollups(cursor)
+        database.rebuild_balance_checkpoints(cursor)
+        cursor.execute("INSERT INTO Operations_fts (Operations_fts, rank) VALUES ('hashsize', ?)",
+                       (FTS_BUILD_HASHSIZE,))
+        cursor.execute("INSERT INTO Operations_fts (Operations_fts) VALUES ('rebuild')")
+        cursor.execute("INSERT INTO Operations_fts (Operations_fts, rank) VALUES ('hashsize', ?)", (FTS_HASHSIZE,))
+        add_budget_limits(cursor, random.Random(seed))
+        cursor.execute("ANALYZE")
+        cursor.execute("COMMIT")
+    except Exception:
+        conn.close()
+        for path in database_files(db_path):
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    conn.close()
+
+
+def add_budget_limits(cursor, rng: random.Random):
+    """ Лимит на каждый месяц для каждой категории расходов - вокруг фактических трат месяца """
+    spent = cursor.execute("""SELECT month, category_id, total_cents FROM Operations_monthly
+                              WHERE operation_type = 'expense'
+                              ORDER BY month, category_id""").fetchall()
+    cursor.executemany("""
+        INSERT INTO Budget_limits (category_id, amount, period_type, start_date, end_date, created_at)
+        VALUES (?, ?, 'month', ?, date(?, '+1 month', '-1 day'), ?)""",
+                       [(category_id, max(100, round(total_cents / 100 * rng.uniform(*BUDGET_SLACK), -2)),
+                         month, month, month) for month, category_id, total_cents in spent])
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Синтетическая БД финансового менеджера для нагрузочных тестов")
+    parser.add_argument('operations', type=int, help="число операций")
+    parser.add_argument('--db', default=database.DB_PATH, help="путь к создаваемому файлу БД")
+    parser.add_argument('--seed', type=int, default=SEED, help="зерно генератора (одинаковое - одинаковая БД)")
+    parser.add_argument('--years', type=int, default=YEARS, help="за сколько лет генерировать операции")
+    parser.add_argument('--end', type=date.fromisoformat, default=END,
+                        help=f"дата последней операции (YYYY-MM-DD), по умол. {END.isoformat()}")
+    parser.add_argument('--force', action='store_true', help="перезаписать существующий файл БД")
+    args = parser.parse_args()
+
+    if args.force:
+        for path in database_files(args.db):
+            if os.path.exists(path):
+                os.remove(path)
+    started = time.perf_counter()
+    generate(args.db, args.operations, args.seed, args.years, args.end)
+    print(f"{args.db}: {args.operations} операций за {time.perf_counter() - started:.1f} с")
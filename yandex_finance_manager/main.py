@@ -1,14 +1,57 @@
+import cProfile
 import sys
-from PyQt6.QtWidgets import QApplication
-from main_window import MainWindow
-import database
+from timings import startup_timer
+
+# --profile[=файл]: замеры обновлений интерфейса и профиль cProfile всего запуска (включая импорт модулей)
+profile_arg = next((arg for arg in sys.argv if arg == '--profile' or arg.startswith('--profile=')), None)
+startup_profile = None
+if profile_arg:
+    startup_profile = cProfile.Profile()
+    startup_profile.enable()
+
+with startup_timer.phase("Импорт модулей"):
+    from PyQt6.QtWidgets import QApplication
+    from PyQt6.QtCore import QTimer
+    import main_window
+    import database
+    import db_methods
+    import profiling
+    from query_runner import query_runner
+
+
+def report_trace():
+    """ Сводка трассировки БД при выходе (если она включена FINANCE_MANAGER_TRACE) """
+    tracer = db_methods.db_manager.tracer
+    print(tracer.report())
+    tracer.save()
 
 
 def main():
-    database.init_database()
+    show_startup_times = '--startup-times' in sys.argv  # вывести в консоль время этапов запуска
+
+    with startup_timer.phase("init_database"):
+        database.init_database()
     app = QApplication(sys.argv)
-    window = MainWindow()
-    window.show()
+    profiler = None
+    if profile_arg:
+        profiler = profiling.start(startup_profile, profile_arg.partition('=')[2] or profiling.PROFILE_PATH)
+        profiling.instrument(main_window)
+        query_runner.busy_changed.connect(profiler.on_query_busy)
+        app.aboutToQuit.connect(profiler.finish)
+    # при выходе сначала дожидаемся фоновых запросов, потом закрываем соединения с БД
+    app.aboutToQuit.connect(query_runner.shutdown)
+    if db_methods.db_manager.tracer is not None:
+        app.aboutToQuit.connect(report_trace)
+    app.aboutToQuit.connect(db_methods.db_manager.close)
+    with startup_timer.phase("Создание окна"):
+        window = main_window.MainWindow()
+    with startup_timer.phase("Показ окна"):
+        window.show()
+    if profiler is not None:
+        profiler.attach_window(window)
+    if show_startup_times:
+        # срабатывает, когда цикл событий обработал первую отрисовку
+        QTimer.singleShot(0, lambda: print(startup_timer.report()))
     sys.exit(app.exec())
 
 
@@ -1,31 +1,54 @@
 from PyQt6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-                             QLabel, QPushButton, QStackedWidget, QFrame)
-from PyQt6.QtCore import Qt, pyqtSignal
-from PyQt6.QtGui import QFont, QPixmap
-from operations_tab import OperationsTab
-from analytics_tab import AnalyticsTab
-from budget_tab import BudgetTab
+                             QLabel, QPushButton, QStackedWidget, QFrame, QDateEdit, QMessageBox)
+from PyQt6.QtCore import Qt, pyqtSignal, QDate
+from PyQt6.QtGui import QFont, QPixmap, QAction
+import importlib
 import db_methods
+import import_dialog
+import export_dialog
+import profiling
+from events import DataChange
+from query_runner import query_runner
+from timings import startup_timer
 from datetime import date
 
+# Вкладки создаются при первом переключении на них: (модуль, класс, атрибут окна)
+# Модули вкладок (и QtCharts вместе с ними) тоже импортируются только тогда
+TABS = [
+    ('operations_tab', 'OperationsTab', 'operations_tab'),
+    ('analytics_tab', 'AnalyticsTab', 'analytics_tab'),
+    ('budget_tab', 'BudgetTab', 'budget_tab'),
+]
+MAX_ALERT_LINES = 20  # сколько предупреждений о лимитах показывать в окне (после импорта их может быть много)
+
 
 class MainWindow(QMainWindow):
-    data_updated = pyqtSignal()
+    data_updated = pyqtSignal(object)  # DataChange - что именно изменилось
+    budget_alerts = pyqtSignal(object)  # список BudgetAlert (может прийти из потока импорта)
 
     def __init__(self):
         super().__init__()
+        self.operations_tab = None
+        self.analytics_tab = None
+        self.budget_tab = None
         self.initUI()
 
-        # Подключаем сигнал ко всем вкладкам, чтобы они обновлялись при изменении данных
-        self.data_updated.connect(self.update_balance_display)
-        self.data_updated.connect(self.operations_tab.refresh_data)
-        self.data_updated.connect(self.analytics_tab.refresh_data)
-        self.data_updated.connect(self.budget_tab.refresh_data)
+        self.data_updated.connect(self.on_data_changed)
+
+        # Сигнал доставит предупреждения в поток интерфейса, даже если запись шла в фоне
+        self.budget_alerts.connect(self.show_budget_alerts)
+        self.alert_listener = self.budget_alerts.emit
+        db_methods.db_manager.budget_alerts.add_listener(self.alert_listener)
+
+        # Сразу создаем только вкладку, которую пользователь увидит первой
+        self.ensure_tab(0)
 
     def initUI(self):
         self.setWindowTitle("Финансовый менеджер")
         self.setGeometry(100, 100, 1200, 900)
 
+        self.create_menu()
+
         central_widget = QWidget()
         self.setCentralWidget(central_widget)
 
@@ -39,6 +62,17 @@ class MainWindow(QMainWindow):
         right_panel = self.create_right_panel()
         main_layout.addWidget(right_panel, 3)
 
+    def create_menu(self):
+        file_menu = self.menuBar().addMenu("Файл")
+
+        import_action = QAction("Импорт выписки (CSV)...", self)
+        import_action.triggered.connect(lambda: import_dialog.show_import_dialog(self))
+        file_menu.addAction(import_action)
+
+        export_action = QAction("Экспорт операций...", self)
+        export_action.triggered.connect(lambda: export_dialog.show_export_dialog(self))
+        file_menu.addAction(export_action)
+
     def create_left_panel(self):
         panel = QFrame()
         panel.setStyleSheet("""
@@ -63,6 +97,16 @@ class MainWindow(QMainWindow):
         self.balance_amount.setStyleSheet("color: #28a745;")
         layout.addWidget(self.balance_amount)
 
+        # Баланс за текущий месяц
+        month_balance_layout = QHBoxLayout()
+        month_balance_label = QLabel("За месяц:")
+        month_balance_label.setFont(QFont("Segoe UI Black", 12))
+        self.month_balance_amount = QLabel("0.0 ₽")
+        self.month_balance_amount.setFont(QFont("Segoe UI Black", 12, QFont.Weight.Bold))
+        month_balance_layout.addWidget(month_balance_label)
+        month_balance_layout.addWidget(self.month_balance_amount)
+        layout.addLayout(month_balance_layout)
+
         # Доходы
         income_layout = QHBoxLayout()
         income_label = QLabel("Доход:")
@@ -85,6 +129,29 @@ class MainWindow(QMainWindow):
         expense_layout.addWidget(self.expense_amount)
         layout.addLayout(expense_layout)
 
+        # Баланс на выбранную дату
+        date_balance_layout = QHBoxLayout()
+        date_balance_label = QLabel("На дату:")
+        date_balance_label.setFont(QFont("Segoe UI Black", 12))
+        self.balance_date_edit = QDateEdit()
+        self.balance_date_edit.setCalendarPopup(True)
+        self.balance_date_edit.setDate(QDate.currentDate())
+        self.balance_date_edit.dateChanged.connect(self.update_date_balance)
+        self.date_balance_amount = QLabel("0.0 ₽")
+        self.date_balance_amount.setFont(QFont("Segoe UI Black", 12, QFont.Weight.Bold))
+        date_balance_layout.addWidget(date_balance_label)
+        date_balance_layout.addWidget(self.balance_date_edit)
+        date_balance_layout.addWidget(self.date_balance_amount)
+        layout.addLayout(date_balance_layout)
+
+        # Индикатор фонового пересчета баланса
+        self.balance_loading_label = QLabel("Обновление...")
+        self.balance_loading_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.balance_loading_label.setStyleSheet("color: #6c757d;")
+        self.balance_loading_label.hide()
+        query_runner.busy_changed.connect(self.on_query_busy)
+        layout.addWidget(self.balance_loading_label)
+
         # Кнопки для переключения между вкладками
         self.create_tab_buttons(layout)
         layout.addStretch()
@@ -155,20 +222,43 @@ class MainWindow(QMainWindow):
 
         self.stacked_widget = QStackedWidget()
 
-        self.operations_tab = OperationsTab(self)
-        self.analytics_tab = AnalyticsTab(self)
-        self.budget_tab = BudgetTab(self)
-
-        self.stacked_widget.addWidget(self.operations_tab)
-        self.stacked_widget.addWidget(self.analytics_tab)
-        self.stacked_widget.addWidget(self.budget_tab)
+        # Пустые заглушки, настоящие вкладки подставляются в ensure_tab
+        for _ in TABS:
+            self.stacked_widget.addWidget(QWidget())
 
         layout.addWidget(self.stacked_widget)
 
         return panel
 
+    def ensure_tab(self, index):
+        """ Создаем вкладку, если ее еще нет """
+        module_name, class_name, attribute = TABS[index]
+        tab = getattr(self, attribute)
+        if tab is not None:
+            return tab
+
+        with startup_timer.phase(f"Вкладка {class_name}"):
+            module = importlib.import_module(module_name)
+            profiling.instrument(module)  # замеры обновлений в режиме --profile
+            tab = getattr(module, class_name)(self)
+            if hasattr(tab, 'refresh_stats'):
+                profiling.watch(class_name, tab.refresh_stats)  # отложенные и отмененные обновления
+
+        placeholder = self.stacked_widget.widget(index)
+        current_index = self.stacked_widget.currentIndex()
+        self.stacked_widget.removeWidget(placeholder)
+        placeholder.deleteLater()
+        self.stacked_widget.insertWidget(index, tab)
+        self.stacked_widget.setCurrentIndex(current_index)
+
+        setattr(self, attribute, tab)
+        # Вкладка сама решает, касается ли ее изменение; скрытая обновится при показе
+        self.data_updated.connect(tab.on_data_changed)
+        return tab
+
     def switch_tab(self, index):
         """ Изменение цветов кнопок при переключении на другую вкладку """
+        self.ensure_tab(index)
         self.stacked_widget.setCurrentIndex(index)
 
         # Сначала сбрасываем все кнопки к обычному состоянию
@@ -205,28 +295,81 @@ class MainWindow(QMainWindow):
                     border-radius: 8px;
                     margin: 5px; """)
 
-    def update_balance_display(self):
-        """ Обновляем отображение баланса """
-        today = date.today()
+    @staticmethod
+    def load_balance(today):
+        """ Баланс и итоги текущего месяца (выполняется в фоновом потоке) """
         first_day = today.replace(day=1)  # первый день текущего месяца
 
+        # Текущий баланс за всё время - по точкам баланса, без суммирования всех операций
+        balance = db_methods.db_manager.get_balance_as_of(today.isoformat())
+
         # Получаем статистику за текущий месяц
         summary = db_methods.db_manager.get_financial_summary(
             first_day.isoformat(),
             today.isoformat()
         )
+        return balance, summary
+
+    def update_balance_display(self):
+        """ Обновляем отображение баланса (данные считаются в фоне) """
+        query_runner.submit('balance', self.load_balance, date.today(), callback=self.show_balance)
+        self.update_date_balance()
+
+    def show_balance(self, result):
+        balance, summary = result
 
         # Обновляем отображаемые значения
-        self.balance_amount.setText(f"{summary['balance']:.2f} ₽")
+        self.balance_amount.setText(f"{balance:.2f} ₽")
+        self.month_balance_amount.setText(f"{summary['balance']:.2f} ₽")
         self.income_amount.setText(f"{summary['income']:.2f} ₽")
         self.expense_amount.setText(f"{summary['expense']:.2f} ₽")
 
         # Меняем цвет в зависимости от того положительный баланс или отрицательный
-        if summary['balance'] >= 0:
-            self.balance_amount.setStyleSheet("color: #28a745;")
+        self.set_amount_color(self.balance_amount, balance)
+        self.set_amount_color(self.month_balance_amount, summary['balance'])
+
+    def update_date_balance(self):
+        """ Баланс на дату, выбранную в левой панели """
+        day = self.balance_date_edit.date().toString(Qt.DateFormat.ISODate)
+        query_runner.submit('date_balance', db_methods.db_manager.get_balance_as_of, day,
+                            callback=self.show_date_balance)
+
+    def show_date_balance(self, balance):
+        self.date_balance_amount.setText(f"{balance:.2f} ₽")
+        self.set_amount_color(self.date_balance_amount, balance)
+
+    def set_amount_color(self, label, amount):
+        if amount >= 0:
+            label.setStyleSheet("color: #28a745;")
         else:
-            self.balance_amount.setStyleSheet("color: #dc3545;")
-
-    def notify_data_updated(self):
-        """ Отправляем сигнал, что данные обновились """
-        self.data_updated.emit()  # отправляем сигнал об обновлении данных
+            label.setStyleSheet("color: #dc3545;")
+
+    def on_query_busy(self, key, busy):
+        if key in ('balance', 'date_balance'):
+            busy = query_runner.is_busy('balance') or query_runner.is_busy('date_balance')
+            self.balance_loading_label.setVisible(busy)
+
+    def on_data_changed(self, change):
+        """ Баланс зависит только от операций """
+        if change.touches('operation'):
+            self.update_balance_display()
+
+    def show_budget_alerts(self, alerts):
+        """ Сообщаем о пересечении порогов лимитов (окно не блокирует работу) """
+        text = "\n".join(alert.message() for alert in alerts[:MAX_ALERT_LINES])
+        if len(alerts) > MAX_ALERT_LINES:
+            text += f"\n... и еще {len(alerts) - MAX_ALERT_LINES}"
+        self.statusBar().showMessage(text.replace("\n", "; "), 15000)
+
+        box = QMessageBox(QMessageBox.Icon.Warning, "Бюджет", text, QMessageBox.StandardButton.Ok, self)
+        box.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose)
+        box.setModal(False)
+        box.show()
+
+    def closeEvent(self, event):
+        db_methods.db_manager.budget_alerts.remove_listener(self.alert_listener)
+        super().closeEvent(event)
+
+    def notify_data_updated(self, change=None):
+        """ Отправляем сигнал, что данные обновились (без описания - обновляется всё) """
+        self.data_updated.emit(change or DataChange.everything())  # отправляем сигнал об обновлении данных
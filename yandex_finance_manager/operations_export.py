@@ -0,0 +1,65 @@
+import csv
+import gzip
+import json
+import db_methods
+
+CHUNK_SIZE = 5000  # сколько операций читаем из БД и пишем в файл за раз
+
+EXPORT_FIELDS = ['id', 'date', 'category_name', 'operation_type', 'amount', 'description']
+EXPORT_FORMATS = ('csv', 'jsonl')
+
+
+def detect_format(path: str):
+    """ (формат, сжимать ли gzip) по расширению файла """
+    name = path.lower()
+    compress = name.endswith('.gz')
+    if compress:
+        name = name[:-3]
+    for export_format in EXPORT_FORMATS:
+        if name.endswith('.' + export_format):
+            return export_format, compress
+    raise ValueError(f"Неизвестный формат файла: {path}")
+
+
+def open_export_file(path: str, compress: bool):
+    if compress:
+        return gzip.open(path, 'wt', encoding='utf-8', newline='')
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+def export_operations(path: str, export_format: str = None, filters: dict = None, compress: bool = None,
+                      progress=None, should_stop=None, db_manager=None):
+    """ Выгрузка операций в CSV или JSON Lines (при необходимости со сжатием gzip)
+
+    Операции читаются курсором порциями, поэтому расход памяти не зависит от размера БД.
+    filters - как у DatabaseManager.get_operations_page (тип, период, категории).
+    progress(выгружено операций) вызывается после каждой порции, should_stop() прерывает выгрузку.
+    Возвращает количество выгруженных операций.
+    """
+    db_manager = db_manager or db_methods.db_manager
+    if export_format is None or compress is None:
+        detected_format, detected_compress = detect_format(path)
+        export_format = export_format or detected_format
+        compress = detected_compress if compress is None else compress
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Неизвестный формат выгрузки: {export_format}")
+
+    exported = 0
+    with open_export_file(path, compress) as export_file:
+        if export_format == 'csv':
+            writer = csv.DictWriter(export_file, fieldnames=EXPORT_FIELDS, extrasaction='ignore')
+            writer.writeheader()
+
+        for chunk in db_manager.iter_operations(filters, chunk_size=CHUNK_SIZE):
+            if export_format == 'csv':
+                writer.writerows(chunk)
+            else:
+                export_file.write(''.join(
+                    json.dumps({field: operation[field] for field in EXPORT_FIELDS}, ensure_ascii=False) + '\n'
+                    for operation in chunk))
+            exported += len(chunk)
+            if progress:
+                progress(exported)
+            if should_stop and should_stop():
+                break
+    return exported
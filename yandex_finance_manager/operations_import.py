@@ -0,0 +1,165 @@
+import csv
+import os
+from datetime import datetime
+from functools import lru_cache
+import db_methods
+
+BATCH_SIZE = 20000  # сколько строк вставляем одной транзакцией
+
+# Возможные названия колонок в выписках (регистр не важен)
+COLUMN_ALIASES = {
+    'date': ('date', 'дата', 'дата операции', 'operation_date'),
+    'amount': ('amount', 'сумма', 'сумма операции'),
+    'category': ('category', 'категория', 'category_name'),
+    'description': ('description', 'описание', 'назначение платежа', 'комментарий'),
+}
+
+DATE_FORMATS = ('%Y-%m-%d', '%d.%m.%Y', '%d/%m/%Y', '%Y-%m-%d %H:%M:%S', '%d.%m.%Y %H:%M:%S', '%d.%m.%Y %H:%M')
+
+# Категории для строк выписки без категории
+DEFAULT_INCOME_CATEGORY = 'Прочие доходы'
+DEFAULT_EXPENSE_CATEGORY = 'Прочие расходы'
+
+
+@lru_cache(maxsize=8192)  # в выписке много операций за одни и те же дни
+def parse_date(text: str):
+    """ Дата из выписки в формате ISO (YYYY-MM-DD) """
+    text = text.strip()
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).date().isoformat()
+        except ValueError:
+            continue
+    raise ValueError(f"Неизвестный формат даты: {text}")
+
+
+def parse_amount(text: str):
+    """ Сумма из выписки: допускаются пробелы между разрядами, запятая и знак ₽ """
+    cleaned = text.replace('\xa0', '').replace(' ', '').replace('₽', '').replace(',', '.')
+    return float(cleaned)
+
+
+def detect_columns(header: list):
+    """ Сопоставляем колонки файла с полями операции по заголовку """
+    normalized = [name.strip().lower() for name in header]
+    columns = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in normalized:
+                columns[field] = normalized.index(alias)
+                break
+    missing = [field for field in ('date', 'amount') if field not in columns]
+    if missing:
+        raise ValueError(f"В файле нет обязательных колонок: {', '.join(missing)}")
+    return columns
+
+
+def _cell(record: list, column):
+    """ Значение необязательной колонки ("" если колонки нет) """
+    if column is None or column >= len(record):
+        return ""
+    return record[column].strip()
+
+
+def iter_statement_rows(statement_file, columns: dict, delimiter: str):
+    """ Построчно читаем выписку, не загружая файл в память
+
+    Возвращает кортежи (дата, название категории, описание, сумма со знаком) или None для битых строк
+    """
+    category_column = columns.get('category')
+    description_column = columns.get('description')
+    for record in csv.reader(statement_file, delimiter=delimiter):
+        if not record:
+            continue
+        try:
+            operation_date = parse_date(record[columns['date']])
+            amount = parse_amount(record[columns['amount']])
+        except (ValueError, IndexError):
+            yield None
+            continue
+        yield operation_date, _cell(record, category_column), _cell(record, description_column), amount
+
+
+class CategoryResolver:
+    """ Перевод названий категорий из выписки в ID, недостающие категории создаются """
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+        self.created = []
+        self._categories = {}
+        for category in db_manager.get_categories():
+            self._categories[category['name'].lower()] = (category['id'], category['category_type'])
+
+    def resolve(self, name: str, amount: float):
+        """ (ID категории, тип операции); без категории тип определяется знаком суммы """
+        if not name:
+            name = DEFAULT_EXPENSE_CATEGORY if amount < 0 else DEFAULT_INCOME_CATEGORY
+        key = name.lower()
+        if key not in self._categories:
+            category_type = 'expense' if amount < 0 else 'income'
+            category_id = self.db_manager.get_or_create_category(name, category_type)
+            if category_id is None:
+                raise RuntimeError(f"Не удалось создать категорию {name}")
+            self._categories[key] = (category_id, category_type)
+            self.created.append(name)
+        return self._categories[key]
+
+
+def import_statement(path: str, progress=None, should_stop=None, encoding: str = 'utf-8-sig',
+                     batch_size: int = BATCH_SIZE, db_manager=None):
+    """ Импорт операций из CSV-выписки банка
+
+    Файл читается потоково, строки вставляются пачками по batch_size в отдельных транзакциях.
+    progress(доля от 0 до 1, импортировано строк) вызывается после каждой пачки,
+    should_stop() позволяет прервать импорт (уже сохраненные пачки остаются в БД).
+    """
+    db_manager = db_manager or db_methods.db_manager
+    total_size = os.path.getsize(path) or 1
+    result = {'imported': 0, 'skipped': 0, 'created_categories': [], 'cancelled': False}
+
+    # предупреждения о лимитах по всем пачкам показываются один раз, когда импорт закончится
+    with open(path, newline='', encoding=encoding) as statement_file, db_manager.budget_alerts.collected():
+        sample = statement_file.read(64 * 1024)
+        statement_file.seek(0)
+        try:
+            delimiter = csv.Sniffer().sniff(sample, delimiters=',;\t').delimiter
+        except csv.Error:
+            delimiter = ','
+
+        header = next(csv.reader(statement_file, delimiter=delimiter), None)
+        if not header:
+            raise ValueError("Файл пустой")
+        columns = detect_columns(header)
+        categories = CategoryResolver(db_manager)
+
+        batch = []
+        for row in iter_statement_rows(statement_file, columns, delimiter):
+            if row is None or row[3] == 0:
+                result['skipped'] += 1
+                continue
+            operation_date, category, description, amount = row
+            category_id, operation_type = categories.resolve(category, amount)
+            batch.append((operation_date, category_id, description, abs(amount), operation_type))
+
+            if len(batch) >= batch_size:
+                batch.sort()  # вставка по порядку дат меньше перестраивает индексы
+                if not db_manager.add_operations_bulk(batch):
+                    raise RuntimeError("Не удалось сохранить операции в БД")
+                result['imported'] += len(batch)
+                batch = []
+                if progress:
+                    # позиция в исходном файле (с точностью до буфера чтения)
+                    progress(statement_file.buffer.tell() / total_size, result['imported'])
+                if should_stop and should_stop():
+                    result['cancelled'] = True
+                    break
+
+        if batch and not result['cancelled']:
+            batch.sort()
+            if not db_manager.add_operations_bulk(batch):
+                raise RuntimeError("Не удалось сохранить операции в БД")
+            result['imported'] += len(batch)
+
+    result['created_categories'] = categories.created
+    if progress and not result['cancelled']:
+        progress(1.0, result['imported'])
+    return result
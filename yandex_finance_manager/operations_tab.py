@@ -1,19 +1,199 @@
-from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QTableWidget,
-                             QTableWidgetItem, QPushButton, QHeaderView, QDialog,
+from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QTableView,
+                             QPushButton, QHeaderView, QDialog,
                              QLabel, QComboBox, QLineEdit, QDateEdit, QMessageBox,
-                             QToolButton, QAbstractItemView)
-from PyQt6.QtCore import Qt, QDate
-from PyQt6.QtGui import QFont
+                             QToolButton, QAbstractItemView, QCheckBox, QMenu)
+from PyQt6.QtCore import Qt, QDate, QAbstractTableModel, QModelIndex, QTimer, QLocale
+from PyQt6.QtGui import QFont, QColor, QDoubleValidator
 import db_methods
+from events import DataChange, DeferredRefreshMixin
+from query_runner import query_runner
 
+SEARCH_DELAY_MS = 300  # пауза после изменения поиска или фильтров перед запросом
+DEFAULT_SORT = ('date', True)  # новые операции сверху
 
-class OperationsTab(QWidget):
+class OperationsTableModel(QAbstractTableModel):
+    """ Модель таблицы операций: строки подгружаются из БД порциями по мере прокрутки """
+    HEADERS = ["Дата", "Категория", "Описание", "Сумма", "Тип"]
+    FETCH_SIZE = 200  # сколько строк загружаем за один раз
+    QUERY_KEY = 'operations_page'  # ключ фоновых запросов порций
+    # столбцы, по которым сортирует БД (у остальных нет подходящего индекса) -> ключ сортировки
+    SORT_COLUMNS = {0: 'date', 3: 'amount', 4: 'type'}
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.filters = {}
+        self.sort_order = DEFAULT_SORT  # (ключ сортировки, по убыванию ли)
+        self._operations = []
+        self._cursor = None  # (столбцы сортировки, id) последней загруженной операции или смещение для поиска
+        self._has_more = True
+        self._loading = False  # порция загружается в фоне
+
+    def reset(self, filters: dict = None, sort_order: tuple = None):
+        """ Сбрасываем загруженные строки, следующая порция загрузится при отображении """
+        query_runner.cancel(self.QUERY_KEY)  # порция для старых фильтров уже не нужна
+        self.beginResetModel()
+        if filters is not None:
+            self.filters = filters
+        if sort_order is not None:
+            self.sort_order = sort_order
+        self._operations = []
+        self._cursor = None
+        self._has_more = True
+        self._loading = False
+        self.endResetModel()
+
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        """ Сортировка по заголовку: строки заново запрашиваются из БД в нужном порядке """
+        sort_key = self.SORT_COLUMNS.get(column)
+        if sort_key is None:
+            return
+        sort_order = (sort_key, order == Qt.SortOrder.DescendingOrder)
+        if sort_order != self.sort_order:
+            self.reset(sort_order=sort_order)
+
+    def sort_column(self):
+        """ Номер столбца текущей сортировки """
+        for column, sort_key in self.SORT_COLUMNS.items():
+            if sort_key == self.sort_order[0]:
+                return column
+        return 0
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._operations)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.HEADERS)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return False
+        return self._has_more and not self._loading
+
+    def fetchMore(self, parent=QModelIndex()):
+        """ Запрашиваем следующую порцию в фоне, строки добавятся в on_page_loaded """
+        if parent.isValid() or not self._has_more or self._loading:
+            return
+        self._loading = True
+        search = self.filters.get('search')
+        if search:
+            # результаты поиска идут по релевантности, курсор - смещение страницы
+            query_runner.submit(self.QUERY_KEY, db_methods.db_manager.search_operations,
+                                search, self.filters, self._cursor, self.FETCH_SIZE,
+                                callback=self.on_page_loaded, error_callback=self.on_page_failed)
+        else:
+            query_runner.submit(self.QUERY_KEY, db_methods.db_manager.get_operations_page,
+                                self._cursor, self.FETCH_SIZE, self.filters, self.sort_order,
+                                callback=self.on_page_loaded, error_callback=self.on_page_failed)
+
+    def on_page_loaded(self, page):
+        operations, self._cursor = page
+        self._loading = False
+        if self._cursor is None:
+            self._has_more = False
+        if not operations:
+            return
+        first = len(self._operations)
+        self.beginInsertRows(QModelIndex(), first, first + len(operations) - 1)
+        self._operations.extend(operations)
+        self.endInsertRows()
+
+    def on_page_failed(self, error):
+        print(f"Ошибка при загрузке операций: {error}")
+        self._loading = False
+        self._has_more = False
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        """ Значения ячеек форматируются только для видимых строк """
+        if not index.isValid():
+            return None
+        operation = self._operations[index.row()]
+        column = index.column()
+
+        if role == Qt.ItemDataRole.DisplayRole:
+            if column == 0:
+                return operation['date']
+            if column == 1:
+                return operation['category_name']
+            if column == 2:
+                return operation['description'] or ""
+            if column == 3:
+                return f"{operation['amount']:.2f} ₽"
+            if column == 4:
+                return "Доход" if operation['category_type'] == 'income' else "Расход"
+        elif role == Qt.ItemDataRole.ForegroundRole and column == 4:
+            if operation['category_type'] == 'income':
+                return QColor(Qt.GlobalColor.green)
+            return QColor(Qt.GlobalColor.red)
+        elif role == Qt.ItemDataRole.UserRole:
+            return operation['id']  # ID операции (скрыто от пользователя)
+        return None
+
+    def matches_filters(self, operation: dict):
+        """ Подходит ли операция под текущие фильтры (кроме поиска) - как условия _operations_filter """
+        filters = self.filters
+        if filters.get('type') in ('income', 'expense') and operation['operation_type'] != filters['type']:
+            return False
+        if filters.get('date_from') and operation['date'] < filters['date_from']:
+            return False
+        if filters.get('date_to') and operation['date'] > filters['date_to']:
+            return False
+        if filters.get('category_ids') and operation['category_id'] not in filters['category_ids']:
+            return False
+        if filters.get('amount_min') is not None and operation['amount'] < filters['amount_min']:
+            return False
+        if filters.get('amount_max') is not None and operation['amount'] > filters['amount_max']:
+            return False
+        return True
+
+    def operation_id(self, row: int):
+        """ ID операции в строке """
+        if 0 <= row < len(self._operations):
+            return self._operations[row]['id']
+        return None
+
+    def row_of(self, operation_id: int):
+        """ Номер загруженной строки с операцией (None, если она еще не загружена) """
+        for row, operation in enumerate(self._operations):
+            if operation['id'] == operation_id:
+                return row
+        return None
+
+    def replace_operation(self, operation: dict):
+        """ Обновляем одну загруженную строку на месте, False - если строки нет """
+        row = self.row_of(operation['id'])
+        if row is None:
+            return False
+        self._operations[row] = operation
+        self.dataChanged.emit(self.index(row, 0), self.index(row, self.columnCount() - 1))
+        return True
+
+    def remove_operation(self, operation_id: int):
+        """ Убираем строку удаленной операции """
+        row = self.row_of(operation_id)
+        if row is None:
+            return
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self._operations[row]
+        self.endRemoveRows()
+
+
+class OperationsTab(DeferredRefreshMixin, QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.parent = parent  # ссылка на главное окно
         self.selected_operation_id = None  # ID выбранной операции для редактирования
+        self.categories_dirty = False  # меню категорий фильтра перечитывается при следующем обновлении
         self.initUI()
-        self.refresh_data()
+        self.data_dirty = True  # данные загрузятся при первом показе вкладки
 
     def initUI(self):
         layout = QVBoxLayout(self)
@@ -76,21 +256,38 @@ class OperationsTab(QWidget):
         layout.addLayout(toolbar_layout)
 
     def create_operations_table(self, layout):
-        self.operations_table = QTableWidget()
-        self.operations_table.setColumnCount(5)  # 5 колонок
-        self.operations_table.setHorizontalHeaderLabels([
-            "Дата", "Категория", "Описание", "Сумма", "Тип"
-        ])
+        self.operations_model = OperationsTableModel(self)
+        self.operations_table = QTableView()
+        self.operations_table.setModel(self.operations_model)
 
         self.operations_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        self.operations_table.verticalHeader().setVisible(False)
         self.operations_table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.operations_table.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
         self.operations_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
 
+        # Сортировка по заголовку выполняется в БД (OperationsTableModel.sort)
+        header = self.operations_table.horizontalHeader()
+        header.setSortIndicator(self.operations_model.sort_column(), Qt.SortOrder.DescendingOrder)
+        self.operations_table.setSortingEnabled(True)
+        header.sortIndicatorChanged.connect(self.on_sort_changed)
+
         # Обработчик выбора строки
-        self.operations_table.itemSelectionChanged.connect(self.on_row_selected)
+        self.operations_table.selectionModel().selectionChanged.connect(self.on_row_selected)
 
         layout.addWidget(self.operations_table)
 
+    def on_sort_changed(self, column, order):
+        """ По столбцам без индекса не сортируем - возвращаем индикатор на текущий столбец """
+        if column in OperationsTableModel.SORT_COLUMNS:
+            return
+        header = self.operations_table.horizontalHeader()
+        descending = self.operations_model.sort_order[1]
+        header.blockSignals(True)
+        header.setSortIndicator(self.operations_model.sort_column(),
+                                Qt.SortOrder.DescendingOrder if descending else Qt.SortOrder.AscendingOrder)
+        header.blockSignals(False)
+
     def create_filter_panel(self, layout):
         filter_layout = QHBoxLayout()
 
@@ -102,8 +299,147 @@ class OperationsTab(QWidget):
         self.filter_combo.currentTextChanged.connect(self.refresh_data)
         filter_layout.addWidget(self.filter_combo)
 
+        # Все фильтры применяются после паузы, чтобы не запрашивать БД на каждое изменение
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DELAY_MS)
+        self.search_timer.timeout.connect(self.refresh_data)
+
+        # Поиск по описанию: запрос уходит после паузы в наборе
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("Поиск по описанию")
+        self.search_edit.setClearButtonEnabled(True)
+        self.search_edit.setMinimumWidth(250)
+        self.search_edit.textChanged.connect(self.search_timer.start)
+        self.search_edit.returnPressed.connect(self.refresh_data)
+        filter_layout.addWidget(self.search_edit)
+
         filter_layout.addStretch()
+
+        # Индикатор фоновой загрузки строк
+        self.loading_label = QLabel("Загрузка...")
+        self.loading_label.setStyleSheet("color: #6c757d;")
+        self.loading_label.hide()
+        query_runner.busy_changed.connect(self.on_query_busy)
+        filter_layout.addWidget(self.loading_label)
+
         layout.addLayout(filter_layout)
+        self.create_extra_filters(layout)
+
+    def create_extra_filters(self, layout):
+        """ Фильтры по периоду, категориям и сумме """
+        extra_layout = QHBoxLayout()
+
+        # Период
+        self.period_check = QCheckBox("Период")
+        self.period_check.toggled.connect(self.on_period_toggled)
+        extra_layout.addWidget(self.period_check)
+        self.start_date_edit = QDateEdit()
+        self.start_date_edit.setCalendarPopup(True)
+        self.start_date_edit.setDate(QDate.currentDate().addMonths(-1))
+        self.start_date_edit.dateChanged.connect(self.search_timer.start)
+        extra_layout.addWidget(QLabel("с:"))
+        extra_layout.addWidget(self.start_date_edit)
+        self.end_date_edit = QDateEdit()
+        self.end_date_edit.setCalendarPopup(True)
+        self.end_date_edit.setDate(QDate.currentDate())
+        self.end_date_edit.dateChanged.connect(self.search_timer.start)
+        extra_layout.addWidget(QLabel("по:"))
+        extra_layout.addWidget(self.end_date_edit)
+        self.start_date_edit.setEnabled(False)
+        self.end_date_edit.setEnabled(False)
+
+        # Категории: меню с флажками, ни одной отмеченной - все категории
+        self.category_btn = QToolButton()
+        self.category_btn.setPopupMode(QToolButton.ToolButtonPopupMode.InstantPopup)
+        self.category_menu = QMenu(self.category_btn)
+        self.category_btn.setMenu(self.category_menu)
+        self.category_menu.triggered.connect(self.on_category_toggled)
+        extra_layout.addWidget(self.category_btn)
+        self.load_categories()
+
+        # Сумма
+        self.amount_min_edit = QLineEdit()
+        self.amount_max_edit = QLineEdit()
+        for edit, placeholder in ((self.amount_min_edit, "от"), (self.amount_max_edit, "до")):
+            validator = QDoubleValidator(0, 1e12, 2, edit)
+            validator.setNotation(QDoubleValidator.Notation.StandardNotation)
+            validator.setLocale(QLocale.c())  # точка как разделитель, как в диалоге операции
+            edit.setValidator(validator)
+            edit.setPlaceholderText(placeholder)
+            edit.setClearButtonEnabled(True)
+            edit.setMaximumWidth(110)
+            edit.textChanged.connect(self.search_timer.start)
+        extra_layout.addWidget(QLabel("Сумма:"))
+        extra_layout.addWidget(self.amount_min_edit)
+        extra_layout.addWidget(self.amount_max_edit)
+
+        reset_btn = QPushButton("Сбросить фильтры")
+        reset_btn.clicked.connect(self.reset_filters)
+        extra_layout.addWidget(reset_btn)
+
+        extra_layout.addStretch()
+        layout.addLayout(extra_layout)
+
+    def on_period_toggled(self, checked):
+        self.start_date_edit.setEnabled(checked)
+        self.end_date_edit.setEnabled(checked)
+        self.search_timer.start()
+
+    def load_categories(self):
+        """ Заполняем меню категорий, сохраняя отмеченные """
+        checked = set(self.checked_category_ids())
+        self.category_menu.clear()
+        for category in db_methods.db_manager.get_categories():
+            action = self.category_menu.addAction(category['name'])
+            action.setCheckable(True)
+            action.setData(category['id'])
+            action.setChecked(category['id'] in checked)
+        self.update_category_button()
+
+    def checked_category_ids(self):
+        return [action.data() for action in self.category_menu.actions() if action.isChecked()]
+
+    def on_category_toggled(self, action):
+        self.update_category_button()
+        self.search_timer.start()
+        # меню остается открытым, чтобы можно было отметить несколько категорий
+        self.category_menu.popup(self.category_btn.mapToGlobal(self.category_btn.rect().bottomLeft()))
+
+    def update_category_button(self):
+        count = len(self.checked_category_ids())
+        self.category_btn.setText(f"Категории: {count}" if count else "Все категории")
+
+    def reset_filters(self):
+        """ Сбрасываем все фильтры одним запросом """
+        for widget in (self.filter_combo, self.search_edit, self.period_check,
+                       self.amount_min_edit, self.amount_max_edit):
+            widget.blockSignals(True)
+        self.filter_combo.setCurrentIndex(0)
+        self.search_edit.clear()
+        self.period_check.setChecked(False)
+        self.on_period_toggled(False)
+        self.amount_min_edit.clear()
+        self.amount_max_edit.clear()
+        for widget in (self.filter_combo, self.search_edit, self.period_check,
+                       self.amount_min_edit, self.amount_max_edit):
+            widget.blockSignals(False)
+        for action in self.category_menu.actions():
+            action.setChecked(False)
+        self.update_category_button()
+        self.refresh_data()
+
+    @staticmethod
+    def amount_value(edit: QLineEdit):
+        """ Число из поля суммы (None, если поле пустое или заполнено не до конца) """
+        try:
+            return float(edit.text().replace(',', '.'))
+        except ValueError:
+            return None
+
+    def on_query_busy(self, key, busy):
+        if key in (OperationsTableModel.QUERY_KEY, 'operation_row', 'operation_action'):
+            self.loading_label.setVisible(busy)
 
     def refresh_data(self):
         """ Обновление данных в таблице """
@@ -115,47 +451,94 @@ class OperationsTab(QWidget):
         elif filter_text == "Только расходы":
             filter_type = "expense"
 
-        operations = db_methods.db_manager.get_all_operations(filter_type)
-        self.operations_table.setRowCount(0)  # очищаем таблицу
-
-        # Заполняем таблицу данными
-        for row, operation in enumerate(operations):
-            self.operations_table.insertRow(row)
-            # Дата
-            self.operations_table.setItem(row, 0, QTableWidgetItem(operation['date']))
-            # Категория
-            self.operations_table.setItem(row, 1, QTableWidgetItem(operation['category_name']))
-            # Описание
-            description = operation['description'] or ""
-            self.operations_table.setItem(row, 2, QTableWidgetItem(description))
-            # Сумма
-            amount_item = QTableWidgetItem(f"{operation['amount']:.2f} ₽")
-            self.operations_table.setItem(row, 3, amount_item)
-            # Тип операции
-            type_text = "Доход" if operation['category_type'] == 'income' else "Расход"
-            type_item = QTableWidgetItem(type_text)
-
-            if operation['category_type'] == 'income':
-                type_item.setForeground(Qt.GlobalColor.green)
-            else:
-                type_item.setForeground(Qt.GlobalColor.red)
+        self.search_timer.stop()
+        if self.categories_dirty:
+            self.categories_dirty = False
+            self.load_categories()
+        filters = {'type': filter_type}
+        if self.period_check.isChecked():
+            start_date = self.start_date_edit.date()
+            end_date = self.end_date_edit.date()
+            if start_date > end_date:
+                start_date, end_date = end_date, start_date
+            filters['date_from'] = start_date.toString(Qt.DateFormat.ISODate)
+            filters['date_to'] = end_date.toString(Qt.DateFormat.ISODate)
+        category_ids = self.checked_category_ids()
+        if category_ids:
+            filters['category_ids'] = tuple(category_ids)
+        amount_min = self.amount_value(self.amount_min_edit)
+        if amount_min is not None:
+            filters['amount_min'] = amount_min
+        amount_max = self.amount_value(self.amount_max_edit)
+        if amount_max is not None:
+            filters['amount_max'] = amount_max
+        search = self.search_edit.text().strip()
+        if search:
+            filters['search'] = search
+
+        # результаты поиска упорядочены по релевантности, сортировка по заголовку к ним не применяется
+        self.operations_table.horizontalHeader().setSortIndicatorShown(not search)
+
+        # Строки загрузятся порциями, когда таблица их запросит
+        self.operations_model.reset(filters)
+        self.on_row_selected()
+
+    def is_affected_by(self, change):
+        return change.touches('operation', 'category')
+
+    def on_data_changed(self, change):
+        if change.touches('category'):
+            self.categories_dirty = True
+        super().on_data_changed(change)
+
+    def apply_change(self, change):
+        """ Точечное обновление таблицы: изменение или удаление одной операции без перезагрузки """
+        if change.entity == 'operation' and len(change.ids) == 1:
+            operation_id = change.ids[0]
+            if change.action == 'delete':
+                self.operations_model.remove_operation(operation_id)
+                self.on_row_selected()
+                return
+            # при поиске измененное описание может перестать подходить - тогда перечитываем список
+            if (change.action == 'update' and len(set(change.dates)) == 1
+                    and self.operations_model.sort_order[0] == 'date'
+                    and not self.operations_model.filters.get('search')):
+                # сортировка по дате, а дата не менялась - позиция строки та же
+                query_runner.submit('operation_row', db_methods.db_manager.get_operation_by_id,
+                                    operation_id, callback=self.on_operation_loaded)
+                return
+        self.refresh_data()
 
-            self.operations_table.setItem(row, 4, type_item)
+    def on_operation_loaded(self, operation):
+        """ Измененная операция прочитана в фоне - заменяем её строку """
+        if operation and self.operations_model.matches_filters(operation):
+            # если строка еще не загружена, она подгрузится уже измененной
+            self.operations_model.replace_operation(operation)
+        elif operation:
+            # операция больше не подходит под фильтры
+            self.operations_model.remove_operation(operation['id'])
+            self.on_row_selected()
+        else:
+            self.refresh_data()
 
-            # Сохраняем ID операции в ячейке (скрыто от пользователя)
-            self.operations_table.item(row, 0).setData(Qt.ItemDataRole.UserRole, operation['id'])
+    def notify_data_changed(self, change):
+        """ Сообщаем главному окну об изменении (оно разошлет его всем вкладкам, включая эту) """
+        if self.parent:
+            self.parent.notify_data_updated(change)
+        else:
+            self.apply_change(change)
 
     def on_row_selected(self):
         """ Обработка выбора строки в таблице """
-        selected_items = self.operations_table.selectedItems()
-        if selected_items:
-            row = selected_items[0].row()
+        selected_rows = self.operations_table.selectionModel().selectedRows()
+        if selected_rows:
             # Достаем ID операции из скрытых данных
-            self.selected_operation_id = self.operations_table.item(row, 0).data(Qt.ItemDataRole.UserRole)
+            self.selected_operation_id = self.operations_model.operation_id(selected_rows[0].row())
             # Активируем кнопки редактирования и удаления
             self.edit_btn.setEnabled(True)
             self.delete_btn.setEnabled(True)
         else:
+            self.selected_operation_id = None
             self.edit_btn.setEnabled(False)
             self.delete_btn.setEnabled(False)
 
@@ -164,9 +547,7 @@ class OperationsTab(QWidget):
         try:
             dialog = OperationDialog(self)
             if dialog.exec() == QDialog.DialogCode.Accepted:
-                self.refresh_data()
-                if self.parent:
-                    self.parent.notify_data_updated()  # сообщаем главному окну об обновлении
+                self.notify_data_changed(dialog.change)  # сообщаем главному окну об обновлении
         except Exception as e:
             QMessageBox.critical(self, 'Ошибка', f'Не удалось открыть диалог: {str(e)}')
 
@@ -176,20 +557,18 @@ class OperationsTab(QWidget):
             QMessageBox.warning(self, 'Ошибка', 'Выберите операцию для редактирования')
             return
 
-        # Находим операцию для редактирования
-        operations = db_methods.db_manager.get_all_operations("all")
-        operation = None
-        for t in operations:
-            if t['id'] == self.selected_operation_id:
-                operation = t
-                break
+        # Операция читается в фоне, диалог откроется, когда она загрузится
+        query_runner.submit('operation_action', db_methods.db_manager.get_operation_by_id,
+                            self.selected_operation_id, callback=self.open_edit_dialog)
 
+    def open_edit_dialog(self, operation):
+        """ Операция для редактирования прочитана в фоне """
         if operation:
             dialog = OperationDialog(self, operation)
             if dialog.exec() == QDialog.DialogCode.Accepted:
-                self.refresh_data()
-                if self.parent:
-                    self.parent.notify_data_updated()
+                self.notify_data_changed(dialog.change)
+        else:
+            QMessageBox.warning(self, 'Ошибка', 'Не удалось найти операцию')
 
     def delete_operation(self):
         """ Удаление операции """
@@ -201,17 +580,26 @@ class OperationsTab(QWidget):
                                      QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
 
         if reply == QMessageBox.StandardButton.Yes:
-            try:
-                success = db_methods.db_manager.delete_operation(self.selected_operation_id)
-                if success:
-                    QMessageBox.information(self, 'Успех', 'Операция удалена')
-                    self.refresh_data()
-                    if self.parent:
-                        self.parent.notify_data_updated()
-                else:
-                    QMessageBox.warning(self, 'Ошибка', 'Не удалось удалить операцию')
-            except Exception as e:
-                QMessageBox.critical(self, 'Ошибка', f'Ошибка при удалении: {str(e)}')
+            # даты и категория удаляемой операции нужны для DataChange - читаем их в фоне
+            operation_id = self.selected_operation_id
+            query_runner.submit('operation_action', db_methods.db_manager.get_operation_by_id, operation_id,
+                                callback=lambda operation: self.finish_delete(operation_id, operation))
+
+    def finish_delete(self, operation_id, operation):
+        """ Удаление после того, как операция прочитана """
+        try:
+            success = db_methods.db_manager.delete_operation(operation_id)
+            if success:
+                QMessageBox.information(self, 'Успех', 'Операция удалена')
+                change = DataChange('operation', 'delete', [operation_id])
+                if operation:
+                    change = DataChange('operation', 'delete', [operation['id']],
+                                        [operation['date']], [operation['category_id']])
+                self.notify_data_changed(change)
+            else:
+                QMessageBox.warning(self, 'Ошибка', 'Не удалось удалить операцию')
+        except Exception as e:
+            QMessageBox.critical(self, 'Ошибка', f'Ошибка при удалении: {str(e)}')
 
 
 class OperationDialog(QDialog):
@@ -219,6 +607,7 @@ class OperationDialog(QDialog):
     def __init__(self, parent=None, operation=None):
         super().__init__(parent)
         self.operation = operation
+        self.change = None  # DataChange после успешного сохранения
         self.setModal(True)  # делаем окно модальным (блокирует главное окно)
 
         if not operation:
@@ -227,6 +616,7 @@ class OperationDialog(QDialog):
             self.setWindowTitle("Редактировать операцию")
 
         self.initUI()
+        self.load_operation_data()
 
     def initUI(self):
         layout = QVBoxLayout(self)
@@ -332,12 +722,14 @@ class OperationDialog(QDialog):
                 success = db_methods.db_manager.add_operation(
                     amount, category_id, date, description
                 )
+                self.change = DataChange('operation', 'insert', dates=[date], category_ids=[category_id])
             else:
-                # Для редактирования нужно сначала удалить старую операцию и создать новую
-                db_methods.db_manager.delete_operation(self.operation['id'])
-                success = db_methods.db_manager.add_operation(
-                    amount, category_id, date, description
+                success = db_methods.db_manager.update_operation(
+                    self.operation['id'], amount, category_id, date, description
                 )
+                self.change = DataChange('operation', 'update', [self.operation['id']],
+                                         [self.operation['date'], date],
+                                         [self.operation['category_id'], category_id])
 
             if success:
                 self.accept()  # Закрываем диалог с успехом
@@ -0,0 +1,195 @@
+import cProfile
+import time
+from functools import wraps
+from PyQt6.QtCore import QObject, Qt, pyqtSignal
+from PyQt6.QtGui import QKeySequence, QShortcut
+from PyQt6.QtWidgets import QLabel
+from timings import startup_timer
+
+PROFILE_PATH = 'finance_manager.prof'  # файл cProfile по умолчанию (pstats: snakeviz, flameprof, gprof2dot)
+OVERLAY_SHORTCUT = 'F12'
+OVERLAY_ROWS = 12  # сколько самых затратных замеров показывает панель
+
+# Замеряемые методы: класс -> методы обновления (синхронная часть и отрисовка результата фонового запроса)
+PROFILED_METHODS = {
+    'MainWindow': ('ensure_tab', 'update_balance_display', 'show_balance', 'update_date_balance',
+                   'show_date_balance'),
+    'OperationsTab': ('refresh_data', 'apply_change', 'on_operation_loaded'),
+    'OperationsTableModel': ('on_page_loaded',),
+    'AnalyticsTab': ('refresh_data', 'show_data', 'update_bar_chart', 'update_pie_chart'),
+    'BudgetTab': ('refresh_data', 'show_data', 'show_budget_limits', 'show_overview'),
+}
+
+
+class RefreshStats:
+    """ Время вызовов одного замера """
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.last_ms = 0.0
+
+    def add(self, ms: float):
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.last_ms = ms
+
+
+class RefreshProfiler(QObject):
+    """ Режим --profile: время обновлений вкладок и фоновых запросов, профиль cProfile всего запуска
+
+    cProfile видит только поток интерфейса; время запросов в пуле потоков учитывается как
+    "запрос <ключ>" - от отправки в query_runner до показа результата.
+    """
+    updated = pyqtSignal(str, float)  # (замер, мс)
+
+    def __init__(self, profile: cProfile.Profile = None, profile_path: str = PROFILE_PATH):
+        super().__init__()
+        self.profile = profile
+        self.profile_path = profile_path
+        self.stats = {}  # название замера -> RefreshStats
+        self._query_started = {}  # ключ запроса -> время отправки
+        self.counters = {}  # название -> функция, возвращающая словарь счетчиков (например, AnalyticsTab.refresh_stats)
+        self.overlay = None
+        self.status_label = None
+
+    def wrap(self, name, method):
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.record(name, (time.perf_counter() - start) * 1000)
+        wrapper.profiled = True
+        return wrapper
+
+    def record(self, name, ms):
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = RefreshStats()
+        stats.add(ms)
+        self.updated.emit(name, ms)
+
+    def on_query_busy(self, key, busy):
+        """ Длительность фоновых запросов по сигналу query_runner.busy_changed """
+        if busy:
+            self._query_started[key] = time.perf_counter()
+        elif key in self._query_started:
+            self.record(f"запрос {key}", (time.perf_counter() - self._query_started.pop(key)) * 1000)
+
+    def watch(self, name, stats):
+        """ Показывать в сводке счетчики, которые возвращает stats() """
+        self.counters[name] = stats
+
+    def attach_window(self, window):
+        """ Последний замер в строке состояния и панель со сводкой (показывается по F12) """
+        self.status_label = QLabel()
+        self.status_label.setStyleSheet("color: #6c757d;")
+        window.statusBar().addPermanentWidget(self.status_label)
+
+        self.overlay = QLabel(window)
+        self.overlay.setAttribute(Qt.WidgetAttribute.WA_TransparentForMouseEvents)
+        self.overlay.setStyleSheet("""
+                background-color: rgba(0, 0, 0, 220);
+                color: white;
+                font-family: monospace;
+                padding: 8px;
+                border-radius: 6px; """)
+        self.overlay.hide()
+        shortcut = QShortcut(QKeySequence(OVERLAY_SHORTCUT), window)
+        shortcut.activated.connect(self.toggle_overlay)
+
+        self.updated.connect(self.on_updated)
+        self.status_label.setText(f"Профилирование: {OVERLAY_SHORTCUT} - сводка")
+
+    def on_updated(self, name, ms):
+        if self.status_label is not None:
+            self.status_label.setText(f"{name}: {ms:.1f} мс")
+        if self.overlay is not None and self.overlay.isVisible():
+            self.update_overlay()
+
+    def toggle_overlay(self):
+        if self.overlay.isVisible():
+            self.overlay.hide()
+        else:
+            self.update_overlay()
+            self.overlay.show()
+            self.overlay.raise_()
+
+    def update_overlay(self):
+        self.overlay.setText(self.report(OVERLAY_ROWS))
+        self.overlay.adjustSize()
+        window = self.overlay.parentWidget()
+        self.overlay.move(window.width() - self.overlay.width() - 10, 10)
+
+    def report(self, rows: int = None):
+        """ Этапы запуска и самые затратные замеры (по суммарному времени) """
+        lines = ["Этапы запуска:"]
+        width = max((len(name) for name, _ in startup_timer.phases), default=0)
+        for name, seconds in startup_timer.phases:
+            lines.append(f"  {name:<{width}}  {seconds * 1000:8.1f} мс")
+
+        ordered = sorted(self.stats.items(), key=lambda item: -item[1].total_ms)
+        if rows is not None:
+            ordered = ordered[:rows]
+        lines.append("Обновления (вызовов / последнее / среднее / макс., мс):")
+        width = max((len(name) for name, _ in ordered), default=0)
+        for name, stats in ordered:
+            lines.append(f"  {name:<{width}}  {stats.count:5}  {stats.last_ms:8.1f}  "
+                         f"{stats.total_ms / stats.count:8.1f}  {stats.max_ms:8.1f}")
+
+        if self.counters:
+            lines.append("Счетчики:")
+            for name, stats in self.counters.items():
+                values = ", ".join(f"{key} = {value}" for key, value in stats().items())
+                lines.append(f"  {name}: {values}")
+        return "\n".join(lines)
+
+    def finish(self):
+        """ При выходе: сводка в консоль и профиль cProfile в файл """
+        print(self.report())
+        if self.profile is None:
+            return
+        self.profile.disable()
+        try:
+            self.profile.dump_stats(self.profile_path)
+            print(f"Профиль сохранен в {self.profile_path}")
+        except OSError as e:
+            print(f"Ошибка при сохранении профиля: {e}")
+
+
+profiler = None  # RefreshProfiler, если программа запущена с --profile
+
+
+def start(profile: cProfile.Profile = None, profile_path: str = PROFILE_PATH):
+    """ Включаем замеры (вызывается из main.py до создания окна) """
+    global profiler
+    profiler = RefreshProfiler(profile, profile_path)
+    return profiler
+
+
+def watch(name, stats):
+    """ Счетчики объекта в сводке --profile (без --profile ничего не делает) """
+    if profiler is not None:
+        profiler.watch(name, stats)
+
+
+def instrument(module):
+    """ Оборачиваем методы классов модуля из PROFILED_METHODS (без --profile ничего не делает)
+
+    Обертка ставится на класс до создания объектов, поэтому замеряются и вызовы через
+    сигналы, подключенные в конструкторе
+    """
+    if profiler is None:
+        return
+    for class_name, methods in PROFILED_METHODS.items():
+        cls = getattr(module, class_name, None)
+        if not isinstance(cls, type):
+            continue
+        for name in methods:
+            method = cls.__dict__.get(name)
+            if method is None or getattr(method, 'profiled', False):
+                continue
+            setattr(cls, name, profiler.wrap(f"{class_name}.{name}", method))
@@ -0,0 +1,146 @@
+import itertools
+import threading
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+import db_methods
+
+MAX_THREADS = 2  # SQLite все равно пишет в один поток, читателям больше двух потоков не нужно
+
+
+class _QuerySignals(QObject):
+    """ Сигналы из рабочих потоков, доставляются в поток интерфейса """
+    finished = pyqtSignal(int, object)  # (ID запроса, результат)
+    failed = pyqtSignal(int, str)  # (ID запроса, текст ошибки)
+
+
+class _QueryTask(QRunnable):
+    def __init__(self, request_id, function, args, kwargs, cancel_event, signals):
+        super().__init__()
+        self.request_id = request_id
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.cancel_event = cancel_event
+        self.signals = signals
+
+    def run(self):
+        if self.cancel_event.is_set():
+            return
+        # отмена прерывает и уже выполняющийся SQL-запрос
+        db_methods.db_manager.set_cancel_event(self.cancel_event)
+        try:
+            result = self.function(*self.args, **self.kwargs)
+        except Exception as e:
+            if not self.cancel_event.is_set():
+                self.signals.failed.emit(self.request_id, str(e))
+        else:
+            if not self.cancel_event.is_set():
+                self.signals.finished.emit(self.request_id, result)
+        finally:
+            db_methods.db_manager.set_cancel_event(None)
+
+
+class QueryRunner(QObject):
+    """ Выполнение запросов к БД в пуле потоков, чтобы окно не зависало
+
+    Запросы группируются по ключу: новый запрос с тем же ключом отменяет предыдущий
+    ("побеждает последний"), результат отмененного запроса никогда не попадет в callback.
+    callback вызывается в потоке интерфейса.
+    """
+    busy_changed = pyqtSignal(str, bool)  # (ключ, выполняется ли запрос)
+
+    def __init__(self, max_threads: int = MAX_THREADS, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads)
+        self.pool.setExpiryTimeout(-1)  # потоки не завершаются, чтобы не терять их соединения с БД
+
+        self._ids = itertools.count(1)
+        self._latest = {}  # ключ -> ID последнего запроса
+        self._requests = {}  # ID -> (ключ, callback, error_callback, событие отмены)
+        self._cancelled = {}  # ключ -> сколько запросов отменено (результат не понадобился)
+        self._lock = threading.Lock()
+
+        self._signals = _QuerySignals()
+        self._signals.finished.connect(self._on_finished)
+        self._signals.failed.connect(self._on_failed)
+
+    def submit(self, key: str, function, *args, callback=None, error_callback=None, **kwargs):
+        """ Запустить function(*args, **kwargs) в фоне, вернуть ID запроса """
+        request_id = next(self._ids)
+        cancel_event = threading.Event()
+        with self._lock:
+            previous = self._latest.get(key)
+            if previous is not None:
+                self._cancel_request(previous)
+            self._latest[key] = request_id
+            self._requests[request_id] = (key, callback, error_callback, cancel_event)
+        if previous is None:
+            self.busy_changed.emit(key, True)
+
+        self.pool.start(_QueryTask(request_id, function, args, kwargs, cancel_event, self._signals))
+        return request_id
+
+    def cancel(self, key: str):
+        """ Отменить текущий запрос с этим ключом """
+        with self._lock:
+            request_id = self._latest.pop(key, None)
+            if request_id is not None:
+                self._cancel_request(request_id)
+        if request_id is not None:
+            self.busy_changed.emit(key, False)
+
+    def cancelled_count(self, key: str = None):
+        """ Число отмененных запросов по ключу (без ключа - по всем) """
+        with self._lock:
+            if key is None:
+                return sum(self._cancelled.values())
+            return self._cancelled.get(key, 0)
+
+    def is_busy(self, key: str):
+        with self._lock:
+            return key in self._latest
+
+    def shutdown(self, timeout_ms: int = 3000):
+        """ Отменить все запросы и дождаться рабочих потоков (при выходе из программы) """
+        with self._lock:
+            for request_id in list(self._requests):
+                self._cancel_request(request_id)
+            self._latest.clear()
+        self.pool.clear()
+        self.pool.waitForDone(timeout_ms)
+
+    def _cancel_request(self, request_id):
+        request = self._requests.pop(request_id, None)
+        if request is not None:
+            request[3].set()
+            self._cancelled[request[0]] = self._cancelled.get(request[0], 0) + 1
+
+    def _take_latest(self, request_id):
+        """ Забираем запрос, если он все еще последний по своему ключу """
+        with self._lock:
+            request = self._requests.pop(request_id, None)
+            if request is None:
+                return None
+            key = request[0]
+            if self._latest.get(key) == request_id:
+                del self._latest[key]
+        self.busy_changed.emit(key, False)
+        return request
+
+    def _on_finished(self, request_id, result):
+        request = self._take_latest(request_id)
+        if request is not None and request[1] is not None:
+            request[1](result)
+
+    def _on_failed(self, request_id, error):
+        request = self._take_latest(request_id)
+        if request is None:
+            return
+        if request[2] is not None:
+            request[2](error)
+        else:
+            print(f"Ошибка фонового запроса {request[0]}: {error}")
+
+
+# Создаем один исполнитель запросов во всей программе
+query_runner = QueryRunner()
@@ -0,0 +1,33 @@
+import time
+from contextlib import contextmanager
+
+
+class StartupTimer:
+    """ Замер длительности этапов запуска программы """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = []  # (название этапа, секунды)
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+    def elapsed(self):
+        """ Секунды с момента импорта модуля """
+        return time.perf_counter() - self.started
+
+    def report(self):
+        """ Текстовая таблица этапов для вывода в консоль """
+        lines = ["Время запуска:"]
+        width = max((len(name) for name, _ in self.phases), default=0)
+        for name, seconds in self.phases:
+            lines.append(f"  {name:<{width}}  {seconds * 1000:8.1f} мс")
+        lines.append(f"  {'Всего с момента запуска':<{width}}  {self.elapsed() * 1000:8.1f} мс")
+        return "\n".join(lines)
+
+
+startup_timer = StartupTimer()